@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the pdf to csv pipeline with synthetic reports, runs offline with no input files
+Created on Sat Oct 17 2026
+@author: Dan Cutright, PhD
+"""
+
+from __future__ import print_function
+from os.path import join
+from os import makedirs
+from time import time
+from tempfile import mkdtemp
+from shutil import rmtree
+import platform
+import argparse
+import json
+from IQDM.parsers.parser import CLASSIFIER, ReportParser, PREVIEW_PAGE_COUNT
+from IQDM.utilities import DELIMITER
+from IQDM.pdf_to_text import convert_pdf_to_txt
+from IQDM.main import CURRENT_VERSION
+
+try:
+    from pdfminer import __version__ as PDFMINER_VERSION
+except ImportError:
+    PDFMINER_VERSION = 'unknown'
+
+
+STAGES = ['extract', 'classify', 'parse', 'serialize']
+DEFAULT_ITERATIONS = 20  # number of times each fixture is processed
+
+# Text blocks of a Delta4 report, as returned by convert_pdf_to_txt, blocks are separated by a blank line
+DELTA4_BLOCKS = [['Doe^John', 'PAT001', 'Clinic A', 'PRE-TREATMENT REPORT'],
+                 ['Treatment Summary', 'Radiation Device: LA1', '1/15/2020 10:30 AM', 'Measured',
+                  '1/15/2020 11:00 AM'],
+                 ['Beam Gantry [°]'],
+                 ['Composite', 'Beam 1', 'Beam 2'],
+                 ['181.0°', '179.0°'],
+                 ['Daily corr Norm Dose Dev DTA Gamma Dose Dev', 'units', '2.000 Gy 1.5% 98.5% 99.0% 97.5%',
+                  '1.000 Gy 1.2% 98.0% 99.5% 97.0%', '1.000 Gy 1.8% 99.0% 98.5% 98.0%'],
+                 ['1.002', '0.998'],
+                 ['6 MV'],
+                 ['Parameter Definitions & Acceptance Criteria, Detectors', 'Dose deviation ±3%', '3.0 mm', 'Gamma',
+                  'Acceptance Limits', '95% of detectors'],
+                 ['ScandiDos AB', 'Selected Detectors']]
+
+# Text blocks of an SNC Patient (ArcCHECK) report
+SNC_BLOCKS = [['Date: 1/16/2020', 'Hospital Name: Clinic A'],
+              ['QA File Parameter', 'Patient Name', 'Patient ID', 'Plan Date', 'Energy', 'Angle'],
+              ['DOE, JANE', 'PAT002', '1/15/2020', '6 MV', '0'],
+              ['Plan', 'SSD', 'CAX offset X: 0.1 Y: -0.2'],
+              ['Absolute Dose Comparison', 'Difference (%)', 'Distance (mm)', 'Threshold (%)', 'Meas Uncertainty'],
+              ['3.0', '3.0', '10.0', 'Yes'],
+              ['Summary (Gamma Analysis)', 'Total Points', 'Passed', 'Failed', '% Passed'],
+              ['1000', '985', '15', '98.5'],
+              ['Gamma Index Summary', 'Minimum', '0.01', 'Maximum', '1.52', 'Average', '0.35', 'Stdv', '0.21'],
+              ['Depth', 'Reviewed By :', 'Notes', 'Benchmark fixture'],
+              ['Threshold']]
+
+# Additional pages appended to the generated pdfs, not needed to parse the report
+DETAIL_PAGE_BLOCKS = [['Beam details'], ['Gamma histogram and dose profiles are images in a real report']]
+
+
+def blocks_to_text(blocks):
+    """
+    :param blocks: list of text blocks, each a list of lines
+    :type blocks: list
+    :return: blocks in the format of convert_pdf_to_txt, each line followed by a line break, and each block followed
+             by a blank line
+    :rtype: str
+    """
+    return ''.join(['\n'.join(block) + '\n\n' for block in blocks])
+
+
+FIXTURES = {'delta4': blocks_to_text(DELTA4_BLOCKS),
+            'sncpatient': blocks_to_text(SNC_BLOCKS)}
+
+
+def escape_pdf_string(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def write_pdf(file_path, pages):
+    """
+    Write a minimal pdf with text only, so benchmarks do not depend on a pdf library or report files
+    :param file_path: output file path
+    :type file_path: str
+    :param pages: text blocks of each page, see DELTA4_BLOCKS
+    :type pages: list
+    """
+    font_id = 3
+    objects = {1: b'<< /Type /Catalog /Pages 2 0 R >>',
+               font_id: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>'}
+    page_ids = []
+    for blocks in pages:
+        commands, y = [], 760
+        for block in blocks:
+            for line in block:
+                commands.append('BT /F1 10 Tf 72 %s Td (%s) Tj ET' % (y, escape_pdf_string(line)))
+                y -= 12
+            y -= 24  # gap between blocks so layout analysis keeps them separate
+        stream = '\n'.join(commands).encode('cp1252')
+        page_id, content_id = max(objects) + 1, max(objects) + 2
+        objects[page_id] = ('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %s 0 R '
+                            '/Resources << /Font << /F1 %s 0 R >> >> >>' % (content_id, font_id)).encode('ascii')
+        objects[content_id] = b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream'
+        page_ids.append(page_id)
+    objects[2] = ('<< /Type /Pages /Kids [%s] /Count %s >>' %
+                  (' '.join(['%s 0 R' % page_id for page_id in page_ids]), len(page_ids))).encode('ascii')
+
+    data = b'%PDF-1.4\n'
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(data)
+        data += b'%d 0 obj\n' % object_id + objects[object_id] + b'\nendobj\n'
+    xref_offset = len(data)
+    data += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for object_id in sorted(objects):
+        data += b'%010d 00000 n \n' % offsets[object_id]
+    data += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref_offset)
+
+    with open(file_path, 'wb') as doc:
+        doc.write(data)
+
+
+def write_pdf_fixtures(directory, detail_page_count=3):
+    """
+    :param directory: directory to store the generated pdfs
+    :type directory: str
+    :param detail_page_count: number of pages appended after the report pages
+    :type detail_page_count: int
+    :return: fixture name: file path of the generated pdf
+    :rtype: dict
+    """
+    file_paths = {}
+    for name, blocks in [('delta4', DELTA4_BLOCKS), ('sncpatient', SNC_BLOCKS)]:
+        file_paths[name] = join(directory, '%s_benchmark.pdf' % name)
+        write_pdf(file_paths[name], [blocks] + [DETAIL_PAGE_BLOCKS] * detail_page_count)
+    return file_paths
+
+
+def run_pipeline(text, file_path, timing):
+    """
+    Equivalent of main.text_to_qa_result, with the duration of each stage added to timing
+    :param text: output from convert_pdf_to_txt
+    :type text: str
+    :param file_path: file the text was converted from
+    :type file_path: str
+    :param timing: stage: list of durations in seconds
+    :type timing: dict
+    :return: csv row, None if the text was not identified as a report
+    :rtype: str
+    """
+    start_time = time()
+    report_class = CLASSIFIER.get_report_class(text)
+    timing['classify'].append(time() - start_time)
+    if report_class is None:
+        return None
+
+    start_time = time()
+    report = report_class()
+    report.process_data(text)
+    timing['parse'].append(time() - start_time)
+
+    start_time = time()
+    row = report.csv + DELIMITER + file_path
+    timing['serialize'].append(time() - start_time)
+    return row
+
+
+def benchmark_fixture(text=None, file_path=None, iterations=DEFAULT_ITERATIONS):
+    """
+    :param text: report text, used to benchmark parsing without pdf conversion
+    :type text: str
+    :param file_path: pdf file, used to benchmark the complete pipeline
+    :type file_path: str
+    :param iterations: number of times the fixture is processed
+    :type iterations: int
+    :return: timing summary of each stage, files per second, and the csv row
+    :rtype: dict
+    """
+    timing = {stage: [] for stage in STAGES}
+    row = None
+    start_time = time()
+    for _ in range(iterations):
+        if file_path is not None:
+            extract_start = time()
+            text = convert_pdf_to_txt(file_path, preview_filter=ReportParser.is_candidate,
+                                      preview_page_count=PREVIEW_PAGE_COUNT, max_pages=ReportParser.get_max_pages(),
+                                      laparams_selector=ReportParser.get_laparams)
+            timing['extract'].append(time() - extract_start)
+        row = None if text is None else run_pipeline(text, file_path or 'benchmark', timing)
+    total_time = time() - start_time
+
+    stages = {}
+    for stage, durations in timing.items():
+        if durations:
+            stages[stage] = {'total': sum(durations),
+                             'mean': sum(durations) / len(durations),
+                             'min': min(durations),
+                             'max': max(durations)}
+    return {'iterations': iterations,
+            'total': total_time,
+            'files_per_sec': iterations / total_time if total_time else None,
+            'stages': stages,
+            'csv': row}
+
+
+def run_benchmarks(iterations=DEFAULT_ITERATIONS, work_dir=None):
+    """
+    Benchmark the text fixtures and the generated pdfs of each report type
+    :param iterations: number of times each fixture is processed
+    :type iterations: int
+    :param work_dir: directory for the generated pdfs, a temporary directory is used and removed if None
+    :type work_dir: str
+    :return: benchmark results with version information, suitable for json
+    :rtype: dict
+    """
+    results = {'iqdm_version': CURRENT_VERSION,
+               'pdfminer_version': PDFMINER_VERSION,
+               'python_version': platform.python_version(),
+               'platform': platform.platform(),
+               'benchmarks': {}}
+
+    for name, text in FIXTURES.items():
+        results['benchmarks']['%s_text' % name] = benchmark_fixture(text=text, iterations=iterations)
+
+    temp_dir = None
+    if work_dir is None:
+        temp_dir = work_dir = mkdtemp()
+    else:
+        makedirs(work_dir, exist_ok=True)
+    try:
+        for name, file_path in write_pdf_fixtures(work_dir).items():
+            results['benchmarks']['%s_pdf' % name] = benchmark_fixture(file_path=file_path, iterations=iterations)
+    finally:
+        if temp_dir is not None:
+            rmtree(temp_dir)
+
+    return results
+
+
+def print_results(results):
+    print('IQDM v%s, pdfminer %s, python %s' %
+          (results['iqdm_version'], results['pdfminer_version'], results['python_version']))
+    print('%-18s %10s' % ('benchmark', 'files/sec') + ''.join(['%14s' % ('%s ms' % stage) for stage in STAGES]))
+    for name, result in results['benchmarks'].items():
+        stage_times = ['%14.3f' % (1000 * result['stages'][stage]['mean']) if stage in result['stages'] else
+                       '%14s' % '-' for stage in STAGES]
+        print('%-18s %10.1f' % (name, result['files_per_sec'] or 0.) + ''.join(stage_times))
+        if result['csv'] is None:
+            print('WARNING: %s was not identified as a report' % name)
+
+
+def main():
+    cmd_parser = argparse.ArgumentParser(description="Benchmark the IQDM pdf to csv pipeline")
+    cmd_parser.add_argument('-n', '--iterations',
+                            dest='iterations',
+                            help='Number of times each fixture is processed, default is %s' % DEFAULT_ITERATIONS,
+                            default=DEFAULT_ITERATIONS,
+                            type=int)
+    cmd_parser.add_argument('-o', '--output',
+                            dest='output',
+                            help='Save results to this json file, for comparison across versions',
+                            default=None)
+    cmd_parser.add_argument('-wd', '--work-dir',
+                            dest='work_dir',
+                            help='Keep the generated pdfs in this directory, a temporary directory is used by default',
+                            default=None)
+    args = cmd_parser.parse_args()
+
+    results = run_benchmarks(iterations=max(1, args.iterations), work_dir=args.work_dir)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as doc:
+            json.dump(results, doc, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide cache of results datasets, shared by every session of a bokeh server so a results csv is loaded once
+Created on Sat Oct 17 2026
+@author: Dan Cutright, PhD
+"""
+
+from os.path import abspath, getmtime
+from threading import Lock
+import numpy as np
+from IQDM.utilities import import_csv_with_state
+
+
+DATASETS = {}  # (file path, modification time, day_first): SharedDataset
+DATASETS_LOCK = Lock()
+
+
+def set_read_only(value):
+    """
+    :param value: np.ndarray, or a dict, list, or tuple of these
+    :return: value, with every array set to read-only so a session can not change data shared with other sessions
+    """
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for item in value.values():
+            set_read_only(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            set_read_only(item)
+    return value
+
+
+class SharedDataset:
+    """
+    Output of import_csv and values derived from it, shared by every session. Arrays are read-only, a session needing
+    different values (e.g., rows added by the live mode of the Delta4 dashboard) must create new arrays.
+    """
+    def __init__(self, data, file_state=None):
+        """
+        :param data: output from import_csv
+        :type data: dict
+        :param file_state: state of the csv data was read from, see import_csv_with_state
+        :type file_state: dict
+        """
+        self.data = set_read_only(data)
+        self.file_state = file_state
+        self.derived = {}
+        self.lock = Lock()
+
+    def get(self, name, function):
+        """
+        :param name: unique name of the derived value
+        :type name: str
+        :param function: called with self.data if the value is not yet computed
+        :return: the memoized, read-only output of function
+        """
+        with self.lock:
+            if name not in self.derived:
+                self.derived[name] = set_read_only(function(self.data))
+            return self.derived[name]
+
+
+def get_dataset(file_path, day_first=False):
+    """
+    Sessions requesting a dataset while it is loaded wait for it rather than loading it again
+    :param file_path: results csv file created by process_files
+    :type file_path: str
+    :param day_first: assume day first for ambiguous dates
+    :type day_first: bool
+    :return: the dataset of the current version of file_path, datasets of previous versions are released
+    :rtype: SharedDataset
+    """
+    file_path = abspath(file_path)
+    key = (file_path, getmtime(file_path), day_first)
+    with DATASETS_LOCK:
+        if key not in DATASETS:
+            for old_key in [k for k in DATASETS if k[0] == file_path and k[2] == day_first]:
+                DATASETS.pop(old_key)
+            DATASETS[key] = SharedDataset(*import_csv_with_state(file_path, day_first=day_first))
+        return DATASETS[key]
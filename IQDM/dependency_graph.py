@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Dependency graph with memoized nodes, used by the trending dashboards so a widget change only recomputes the views
+that depend on it
+Created on Sat Oct 17 2026
+@author: Dan Cutright, PhD
+"""
+
+
+class DependencyGraph:
+    """
+    Each node is a function of the values of its dependencies. A node's value is memoized until the node is
+    invalidated, invalidating a node also invalidates every node that depends on it. Input nodes (e.g., the value of a
+    widget) have no dependencies, view nodes update a plot and are re-evaluated by refresh().
+    """
+    def __init__(self):
+        self.nodes = {}  # name: {'function', 'dependencies', 'value', 'valid'}
+        self.dependents = {}  # name: names of nodes with name as a dependency
+        self.views = []
+
+    def add(self, name, function, dependencies=None, view=False):
+        """
+        :param name: unique name of the node
+        :type name: str
+        :param function: called with the value of each dependency, in order
+        :param dependencies: names of nodes already added
+        :type dependencies: list
+        :param view: if True, the node is re-evaluated by refresh() when invalid
+        :type view: bool
+        """
+        dependencies = dependencies or []
+        self.nodes[name] = {'function': function, 'dependencies': dependencies, 'value': None, 'valid': False}
+        self.dependents[name] = []
+        for dependency in dependencies:
+            self.dependents[dependency].append(name)
+        if view:
+            self.views.append(name)
+
+    def get(self, name):
+        """
+        :param name: name of a node
+        :type name: str
+        :return: the memoized value of the node, computed first if invalid
+        """
+        node = self.nodes[name]
+        if not node['valid']:
+            node['value'] = node['function'](*[self.get(dependency) for dependency in node['dependencies']])
+            node['valid'] = True
+        return node['value']
+
+    def set(self, name, value):
+        """
+        Store a value computed outside of the graph (e.g., updated incrementally), dependents are not invalidated
+        :param name: name of a node
+        :type name: str
+        :param value: new value of the node
+        """
+        self.nodes[name]['value'] = value
+        self.nodes[name]['valid'] = True
+
+    def invalidate(self, *names):
+        """
+        :param names: names of the nodes to invalidate, along with their dependents
+        """
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if self.nodes[name]['valid'] or name in names:
+                self.nodes[name]['valid'] = False
+                stack.extend(self.dependents[name])
+
+    def refresh(self):
+        """
+        Evaluate every invalid view node, in the order added
+        """
+        for name in self.views:
+            if not self.nodes[name]['valid']:
+                self.get(name)
+
+    def update(self, *names):
+        """
+        Invalidate the input nodes in names, then refresh the views
+        """
+        self.invalidate(*names)
+        self.refresh()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Discovery of files to be processed, in a background thread so directory listing overlaps with parsing
+Created on Sat Oct 17 2026
+@author: Dan Cutright, PhD
+"""
+
+from os import scandir
+from os.path import join
+from threading import Thread, Event
+from queue import Queue, Full, Empty
+
+
+DISCOVERY_QUEUE_SIZE = 1000  # maximum number of discovered file paths waiting to be processed
+QUEUE_POLL_INTERVAL = 0.1  # seconds between checks for a stop request while the queue is full
+
+
+def walk_files(init_directory, no_recursive_search=False):
+    """
+    Generator of file paths, in the same order as os.walk (top-down, symbolic links to directories are not followed)
+    :param init_directory: initial scanning directory
+    :type init_directory: str
+    :param no_recursive_search: to ignore sub-directories, set to True
+    :type no_recursive_search: bool
+    """
+    try:
+        with scandir(init_directory) as entries:
+            entries = list(entries)
+    except OSError:  # same as os.walk, inaccessible directories are skipped
+        return
+
+    sub_directories = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if not is_dir:
+            yield join(init_directory, entry.name)
+        elif not no_recursive_search and not entry.is_symlink():
+            sub_directories.append(join(init_directory, entry.name))
+
+    for sub_directory in sub_directories:
+        for file_path in walk_files(sub_directory):
+            yield file_path
+
+
+class EndOfQueue:
+    """Placed in the queue by the producer thread once the iterable is exhausted, or if it raised an exception"""
+    def __init__(self, exception=None):
+        self.exception = exception
+
+
+def iter_in_thread(iterable, queue_size=DISCOVERY_QUEUE_SIZE):
+    """
+    Consume iterable in a background thread, through a bounded queue, so a slow producer (e.g., listing directories
+    on a network share) runs while the items already found are processed
+    :param iterable: e.g., output from main.get_file_paths
+    :param queue_size: maximum number of items produced ahead of the consumer
+    :type queue_size: int
+    :return: generator of the items of iterable, in order. Exceptions of the producer are raised by the generator.
+    """
+    queue = Queue(maxsize=queue_size)
+    stop = Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=QUEUE_POLL_INTERVAL)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(EndOfQueue())
+        except Exception as e:
+            put(EndOfQueue(e))
+
+    thread = Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            try:
+                item = queue.get(timeout=QUEUE_POLL_INTERVAL)
+            except Empty:
+                if not thread.is_alive() and queue.empty():
+                    return
+                continue
+            if isinstance(item, EndOfQueue):
+                if item.exception is not None:
+                    raise item.exception
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
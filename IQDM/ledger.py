@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent record of processed files, used to only process new reports
+Created on Sat Oct 17 2026
+@author: Dan Cutright, PhD
+"""
+
+from os.path import abspath, normpath, normcase, join, isfile
+from os import stat
+import sqlite3
+from threading import Lock
+from IQDM.utilities import split_zip_member_path
+
+
+LEDGER_FILE_NAME = 'iqdm_ledger.db'
+COMMIT_INTERVAL = 100  # number of added files between database commits
+
+
+class ProcessedFileLedger:
+    """
+    SQLite table of processed files keyed by normalized absolute path. A file is considered previously processed if
+    its size and modification time are unchanged since it was added to the ledger. The ledger may be shared between
+    threads, e.g., multiprocessing.Pool.imap consumes its input from a separate thread.
+
+    Members of zip files (<archive>.zip!<member>) use the size and modification time of the zip file, so every member
+    is processed again if the archive changes.
+
+    Files that exceeded the time or memory budget of a scan are recorded in a separate quarantine table, so later scans
+    skip them unless the file changes.
+
+    Files found to not be a report are recorded with the classifier version of the scan, and are only skipped by scans
+    with the same classifier version (e.g., a new report class checks them again).
+    """
+    def __init__(self, db_path, classifier_version=None):
+        """
+        :param db_path: file path of the SQLite database, will be created if it does not exist
+        :type db_path: str
+        :param classifier_version: see ReportParser.get_classifier_version
+        :type classifier_version: str
+        """
+        self.db_path = db_path
+        self.classifier_version = classifier_version
+        self.is_new = not isfile(db_path)
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = Lock()
+        self.connection.execute("CREATE TABLE IF NOT EXISTS processed_files "
+                                "(file_path TEXT PRIMARY KEY, size INTEGER, mtime REAL, report_type TEXT, "
+                                "results_file TEXT, classifier_version TEXT)")
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(processed_files)")]
+        for column in ['results_file', 'classifier_version']:
+            if column not in columns:  # ledger created by an older version
+                self.connection.execute("ALTER TABLE processed_files ADD COLUMN %s TEXT" % column)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS quarantined_files "
+                                "(file_path TEXT PRIMARY KEY, size INTEGER, mtime REAL, reason TEXT)")
+        self.connection.commit()
+        self.uncommitted_count = 0
+        self.results_writer = None  # if set, its rows are fsynced before each commit, see commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM processed_files").fetchone()[0]
+
+    @staticmethod
+    def get_key(file_path):
+        return normcase(normpath(abspath(file_path)))
+
+    @staticmethod
+    def get_file_stats(file_path):
+        """
+        :param file_path: file path, or a zip member path
+        :return: size and modification time of the file (or zip file), None and None if file is not accessible
+        :rtype: tuple
+        """
+        try:
+            file_stats = stat(split_zip_member_path(file_path)[0])
+            return file_stats.st_size, file_stats.st_mtime
+        except OSError:
+            return None, None
+
+    def is_processed(self, file_path):
+        """
+        :param file_path: file path
+        :return: True if file_path is in the ledger and is unchanged since it was added, and was not found to not be a
+                 report with a different classifier version
+        :rtype: bool
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT size, mtime, classifier_version FROM processed_files "
+                                          "WHERE file_path = ?", (self.get_key(file_path),)).fetchone()
+        return row is not None and tuple(row[:2]) == self.get_file_stats(file_path) and \
+            row[2] in {None, self.classifier_version}
+
+    def get_results_file(self, file_path):
+        """
+        :param file_path: file path
+        :return: the results csv file containing the row of file_path, None if not found
+        :rtype: str
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT results_file FROM processed_files WHERE file_path = ?",
+                                          (self.get_key(file_path),)).fetchone()
+        return None if row is None else row[0]
+
+    def add(self, file_path, report_type=None, results_file=None, not_a_report=False):
+        """
+        Add or update a file in the ledger, the file is also removed from the quarantine
+        :param file_path: file path
+        :param report_type: report_type of the parser used, None if file was not identified as a report
+        :type report_type: str
+        :param results_file: the results csv file the row of file_path was written to
+        :type results_file: str
+        :param not_a_report: file was found to not be a report, it is checked again if the classifier version changes
+        :type not_a_report: bool
+        """
+        size, mtime = self.get_file_stats(file_path)
+        if results_file is not None:
+            results_file = self.get_key(results_file)
+        classifier_version = self.classifier_version if not_a_report else None
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO processed_files VALUES (?, ?, ?, ?, ?, ?)",
+                                    (self.get_key(file_path), size, mtime, report_type, results_file,
+                                     classifier_version))
+            self.connection.execute("DELETE FROM quarantined_files WHERE file_path = ?", (self.get_key(file_path),))
+            self.uncommitted_count += 1
+        if self.uncommitted_count >= COMMIT_INTERVAL:
+            self.commit()
+
+    def is_quarantined(self, file_path):
+        """
+        :param file_path: file path
+        :return: True if file_path was quarantined and is unchanged since
+        :rtype: bool
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT size, mtime FROM quarantined_files WHERE file_path = ?",
+                                          (self.get_key(file_path),)).fetchone()
+        return row is not None and tuple(row) == self.get_file_stats(file_path)
+
+    def quarantine(self, file_path, reason):
+        """
+        Record a file to be skipped by later scans, e.g., it exceeded the time limit of a worker
+        :param file_path: file path
+        :param reason: the failure, see main.get_qa_result
+        :type reason: str
+        """
+        size, mtime = self.get_file_stats(file_path)
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO quarantined_files VALUES (?, ?, ?, ?)",
+                                    (self.get_key(file_path), size, mtime, reason))
+            self.uncommitted_count += 1
+        self.commit()  # commit now, so the record is kept if a later file crashes the scan
+
+    def get_quarantined_files(self):
+        """
+        :return: file path and reason of each quarantined file
+        :rtype: list
+        """
+        with self.lock:
+            return [tuple(row) for row in
+                    self.connection.execute("SELECT file_path, reason FROM quarantined_files ORDER BY file_path")]
+
+    def import_processed_files(self, file_paths):
+        """
+        Add files found in results csv files created before the ledger existed
+        :param file_paths: output from utilities.get_processed_files
+        :type file_paths: list
+        """
+        for file_path in file_paths:
+            if isfile(file_path):
+                self.add(file_path)
+        self.commit()
+
+    def commit(self):
+        """
+        Files are only committed as processed once their rows are on disk, so a crash can not lose their rows
+        """
+        if self.results_writer is not None:
+            self.results_writer.sync()
+        with self.lock:
+            self.connection.commit()
+            self.uncommitted_count = 0
+
+    def close(self):
+        self.commit()
+        with self.lock:
+            self.connection.close()
+
+
+def get_ledger(directory=None, classifier_version=None):
+    """
+    :param directory: directory containing the ledger, default is the local directory
+    :type directory: str
+    :param classifier_version: see ReportParser.get_classifier_version
+    :type classifier_version: str
+    :return: the ledger stored in directory
+    :rtype: ProcessedFileLedger
+    """
+    return ProcessedFileLedger(join(directory or '', LEDGER_FILE_NAME), classifier_version=classifier_version)
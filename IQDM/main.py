@@ -6,39 +6,234 @@ Created on Thu May 30 2019
 """
 
 from __future__ import print_function
-from os.path import isdir, isfile, join, splitext, basename, dirname
-from os import walk, listdir
+from os.path import isdir, isfile, splitext
 from datetime import datetime
-from IQDM.parsers.parser import ReportParser
-from IQDM.utilities import DELIMITER, is_file_name_found_in_processed_files, get_processed_files
+from time import time
+from functools import partial
+from IQDM.parsers.parser import ReportParser, PREVIEW_PAGE_COUNT
+from IQDM.utilities import DELIMITER, get_processed_files, get_zip_member_paths, close_open_archive, MAX_PLOT_POINTS
+import zipfile
 from IQDM.pdf_to_text import convert_pdf_to_txt
+from IQDM.text_cache import TextCache, DEFAULT_MAX_SIZE
+from IQDM.ledger import get_ledger
+from IQDM.results import ResultsWriter, CANONICAL_OUTPUT_FILE
+from IQDM.scan_stats import ScanStats, get_initial_stats
+from IQDM.supervisor import SupervisedPool
+from IQDM.discovery import walk_files, iter_in_thread
 import argparse
 from pathvalidate import sanitize_filename
-import subprocess
 
 
 CURRENT_VERSION = '0.3.1'
 
-SCRIPT_DIR = dirname(__file__)
+# get_qa_result failures that quarantine a file, so it is skipped by later scans
+QUARANTINE_FAILURES = ['timeout', 'worker died', 'MemoryError']
 
 
-def pdf_to_qa_result(abs_file_path):
+def pdf_to_qa_result(abs_file_path, text_cache=None):
     """
     Given an absolute file path, convert file to text
     :param abs_file_path: file to be converted to text
+    :param text_cache: optional cache of previously extracted text
+    :type text_cache: TextCache
     :return: csv row to be written to csv file, report type, column headers for csv
     :rtype: tuple
     """
+    return pdf_to_text_and_qa_result(abs_file_path, text_cache=text_cache)[1]
 
-    text = convert_pdf_to_txt(abs_file_path)
 
-    report_obj = ReportParser(text)
+def convert_report_pdf_to_txt(file_path, text_cache=None, max_pages=None, preview_filter=None, stats=None):
+    """
+    convert_pdf_to_txt with the preview page count and layout analysis parameters of the report classes
+    """
+    return convert_pdf_to_txt(file_path, text_cache=text_cache, preview_filter=preview_filter,
+                              preview_page_count=PREVIEW_PAGE_COUNT, max_pages=max_pages,
+                              laparams_selector=ReportParser.get_laparams,
+                              laparams_profiles=ReportParser.get_laparams_profiles(), stats=stats)
+
+
+def pdf_to_text_and_qa_result(file_path, text_cache=None, stats=None):
+    """
+    Only the pages needed by the report classes are converted (see ReportParser.get_max_pages). If that text is not
+    identified as a report, can not be parsed, or is missing a required column, but the pdf may have more pages, every
+    page is converted so a pdf is never found to not be a report (or to fail) from truncated text.
+    :param file_path: file to be converted to text
+    :param text_cache: optional cache of previously extracted text
+    :type text_cache: TextCache
+    :param stats: optional dict to record stage durations, see get_qa_result
+    :type stats: dict
+    :return: text (None if rejected by ReportParser.is_candidate), and output of text_to_qa_result
+    :rtype: tuple
+    """
+    stats = {} if stats is None else stats
+    max_pages = ReportParser.get_max_pages()
+    text = convert_report_pdf_to_txt(file_path, text_cache=text_cache, max_pages=max_pages,
+                                     preview_filter=ReportParser.is_candidate, stats=stats)
+    if text is None:
+        return None, None
+
+    is_truncated = max_pages is not None and stats['pages'] >= max_pages
+    try:
+        report_obj = ReportParser(text, stats=stats)
+        is_complete = report_obj.report is not None and not report_obj.missing_columns
+    except Exception:
+        if not is_truncated:
+            raise
+        is_complete = False
+
+    if not is_complete and is_truncated:
+        truncated_stats = {key: stats[key] for key in ['extract', 'pages']}
+        text = convert_report_pdf_to_txt(file_path, text_cache=text_cache, stats=stats)
+        for key, value in truncated_stats.items():
+            stats[key] += value
+        report_obj = ReportParser(text, stats=stats)
+    return text, report_to_qa_result(report_obj, file_path)
+
+
+def text_to_qa_result(text, abs_file_path, stats=None):
+    """
+    :param text: output from convert_pdf_to_txt
+    :type text: str
+    :param abs_file_path: file the text was converted from
+    :param stats: optional dict to record stage durations, see ReportParser
+    :type stats: dict
+    :return: csv row to be written to csv file, report type, column headers for csv
+    :rtype: tuple
+    """
+    return report_to_qa_result(ReportParser(text, stats=stats), abs_file_path)
+
+
+def report_to_qa_result(report_obj, abs_file_path):
+    """
+    :param report_obj: parsed report
+    :type report_obj: ReportParser
+    :param abs_file_path: file the report was converted from
+    :return: output of text_to_qa_result, None if not a report
+    :rtype: tuple
+    """
     if report_obj.report is not None:
         return report_obj.csv + DELIMITER + abs_file_path, report_obj.report_type, report_obj.columns
 
 
+def get_qa_result(file_path, text_cache=None):
+    """
+    Equivalent of pdf_to_qa_result that never raises, so it can be mapped over a process pool
+    :param file_path: file to be converted to text
+    :param text_cache: optional cache of previously extracted text
+    :type text_cache: TextCache
+    :return: file_path, qa_result (output of pdf_to_qa_result, None if not a report), error (exception message),
+             fast_reject (True if rejected from the first page(s) of the pdf), failure (reason qa_result is None:
+             'fast reject', 'not a report', or the exception type), stats (stage durations in seconds, bytes, pages
+             converted, and cache_hit, see ScanStats)
+    :rtype: dict
+    """
+    result = {'file_path': file_path, 'qa_result': None, 'error': None, 'fast_reject': False, 'failure': None,
+              'stats': get_initial_stats()}
+    try:
+        text, result['qa_result'] = pdf_to_text_and_qa_result(file_path, text_cache=text_cache, stats=result['stats'])
+        if text is None:
+            result['fast_reject'] = True
+            result['failure'] = 'fast reject'
+        elif result['qa_result'] is None:
+            result['failure'] = 'not a report'
+    except Exception as e:
+        result['error'] = str(e) or type(e).__name__  # e.g., MemoryError has no message
+        result['failure'] = type(e).__name__
+    return result
+
+
+def get_failed_qa_result(file_path, failure, error):
+    """
+    Output of get_qa_result for a file whose worker was terminated, see SupervisedPool
+    :param file_path: file that was being processed
+    :param failure: 'timeout' or 'worker died'
+    :type failure: str
+    :param error: description of the failure
+    :type error: str
+    :rtype: dict
+    """
+    return {'file_path': file_path, 'qa_result': None, 'error': error, 'fast_reject': False, 'failure': failure,
+            'stats': get_initial_stats()}
+
+
+def verify_laparams_profile(file_paths, laparams):
+    """
+    Regression check of a layout profile before assigning it to the laparams property of a report class. Every file is
+    parsed with default LAParams and with laparams, csv rows must be identical for the profile to be safe.
+    :param file_paths: pdf files of the report type, e.g., a corpus of previously processed reports
+    :type file_paths: list
+    :param laparams: keyword arguments of LAParams
+    :type laparams: dict
+    :return: file count, file paths with different results, and conversion time in seconds for each profile
+    :rtype: dict
+    """
+    summary = {'files': 0, 'mismatches': [], 'default_time': 0., 'profile_time': 0.}
+    for file_path in file_paths:
+        results = []
+        for selector, time_key in [(None, 'default_time'), (lambda text: laparams, 'profile_time')]:
+            start_time = time()
+            try:
+                text = convert_pdf_to_txt(file_path, max_pages=ReportParser.get_max_pages(),
+                                          laparams_selector=selector)
+                results.append(text_to_qa_result(text, file_path))
+            except Exception as e:
+                results.append(str(e))
+            summary[time_key] += time() - start_time
+        summary['files'] += 1
+        if results[0] != results[1]:
+            summary['mismatches'].append(file_path)
+
+    print("%s of %s files have identical results" % (summary['files'] - len(summary['mismatches']), summary['files']))
+    print("Conversion time: %0.2f s with default LAParams, %0.2f s with profile" %
+          (summary['default_time'], summary['profile_time']))
+    return summary
+
+
+def get_file_paths(init_directory, ignore_extension=False, no_recursive_search=False, ledger=None,
+                   process_all=False, retry_quarantined=False, include_zip=False):
+    """
+    Generator of file paths to be processed by process_files
+    :param init_directory: initial scanning directory
+    :param ignore_extension: if you'd like to catch pdf files that are missing .pdf extension, set to True
+    :type ignore_extension: bool
+    :param no_recursive_search: to ignore sub-directories, set to True
+    :type no_recursive_search: bool
+    :param ledger: if provided, files found unchanged in the ledger or its quarantine are skipped
+    :type ledger: ProcessedFileLedger
+    :param process_all: do not skip files found unchanged in the ledger
+    :type process_all: bool
+    :param retry_quarantined: do not skip files found unchanged in the quarantine of the ledger
+    :type retry_quarantined: bool
+    :param include_zip: also yield the pdfs in zip files, named <archive>.zip!<member>, these are read into memory by
+                        convert_pdf_to_txt rather than extracted to disk
+    :type include_zip: bool
+    """
+    for file_path in walk_files(init_directory, no_recursive_search=no_recursive_search):
+        extension = splitext(file_path)[1].lower()
+        if include_zip and extension == '.zip':
+            try:
+                candidates = get_zip_member_paths(file_path, extension=[None, '.pdf'][not ignore_extension])
+            except (zipfile.BadZipfile, OSError) as e:
+                print('Could not read zip file %s: %s' % (file_path, e))
+                continue
+        elif ignore_extension or extension == '.pdf':
+            candidates = [file_path]
+        else:
+            continue
+
+        for candidate in candidates:
+            if ledger is not None and not retry_quarantined and ledger.is_quarantined(candidate):
+                print('File quarantined: %s' % candidate)
+            elif ledger is not None and not process_all and ledger.is_processed(candidate):
+                print('File previously processed: %s' % candidate)
+            else:
+                yield candidate
+
+
 def process_files(init_directory, ignore_extension=False, output_file=None, output_dir=None, no_recursive_search=False,
-                  process_all=True, results_dir=None):
+                  process_all=True, results_dir=None, jobs=1, cache_dir=None, cache_size=DEFAULT_MAX_SIZE,
+                  binary_store=False, canonical=False, stats_log=None, timeout=None, memory_limit=None,
+                  retry_quarantined=False, include_zip=False):
     """
     Given an initial directory, process all pdf files into parser classes, write their csv property to results_file
     :param init_directory: initial scanning directory
@@ -48,59 +243,126 @@ def process_files(init_directory, ignore_extension=False, output_file=None, outp
     :param output_dir: user specified output directory, default value is to local directory
     :param no_recursive_search: to ignore sub-directories, set to True
     :type no_recursive_search: bool
-    :param process_all: Only process files found in results csv files in the local directory or the specified results_dir
+    :param process_all: Process all files, otherwise skip files found unchanged in the processed file ledger
     :type process_all: bool
-    :param results_dir: directory containing results files
+    :param results_dir: directory containing results files and the processed file ledger, default is output_dir
     :type results_dir: str
+    :param jobs: number of processes used to convert and parse pdfs, results are still written by this process in
+                 the order the files were found
+    :type jobs: int
+    :param timeout: maximum seconds to process a file, the file is quarantined if exceeded. If timeout or memory_limit
+                    is set, files are processed in worker processes even if jobs is 1
+    :type timeout: float
+    :param memory_limit: maximum memory in bytes of each worker process (not supported on Windows), files raising a
+                         MemoryError are quarantined
+    :type memory_limit: int
+    :param retry_quarantined: process files that were quarantined by a previous scan
+    :type retry_quarantined: bool
+    :param include_zip: also process pdfs in zip files, directly from memory. Results and the ledger record these as
+                        <archive>.zip!<member>
+    :type include_zip: bool
+    :param cache_dir: directory used to cache text extracted from pdfs, no caching if None
+    :type cache_dir: str
+    :param cache_size: maximum size of the text cache in bytes
+    :type cache_size: int
+    :param binary_store: also save results as memory-mappable .npy files, used by the trending dashboards if current
+    :type binary_store: bool
+    :param canonical: if output_file is not provided, add results to one dataset per report type
+                      (<report_type>_results_canonical.csv) instead of a new time-stamped file. In either case, rows of
+                      reports that were previously written to the same file are replaced.
+    :type canonical: bool
+    :param stats_log: optional file path to write the stats of each file scanned, as JSON-lines
+    :type stats_log: str
     """
 
-    if process_all:
-        ignored_files = []
-    else:
-        results_dir = [results_dir, ''][results_dir is None]
-        ignored_files = get_processed_files(results_dir, no_recursive_search=no_recursive_search)
+    results_dir = [results_dir, output_dir][results_dir is None]
+    ledger = get_ledger(results_dir, classifier_version=ReportParser.get_classifier_version())
+    if ledger.is_new and not process_all:  # one-time import of files processed before the ledger existed
+        ledger.import_processed_files(get_processed_files(results_dir or '.', no_recursive_search=no_recursive_search))
 
     time_stamp = str(datetime.now()).replace(':', '-').replace('.', '-')
     if output_file is None:
-        output_file = "results_%s.csv" % time_stamp
-
-    if no_recursive_search:
-        for file_name in listdir(init_directory):
-            if not is_file_name_found_in_processed_files(file_name, init_directory, ignored_files):
-                if ignore_extension or splitext(file_name)[1].lower() == '.pdf':
-                    file_path = join(init_directory, file_name)
-                    process_file(file_path, output_file, output_dir)
-            else:
-                print('File previously processed: %s' % join(init_directory, file_name))
-    else:
-        for dirName, subdirList, fileList in walk(init_directory):  # iterate through files and all sub-directories
-            for file_name in fileList:
-                if not is_file_name_found_in_processed_files(file_name, init_directory, ignored_files):
-                    if ignore_extension or splitext(file_name)[1].lower() == '.pdf':
-                        file_path = join(dirName, file_name)
-                        process_file(file_path, output_file, output_dir)
-                else:
-                    print('File previously processed: %s' % join(dirName, file_name))
+        output_file = [CANONICAL_OUTPUT_FILE, "results_%s.csv" % time_stamp][not canonical]
 
+    # rows are fsynced before the ledger commits their files, rows left by a crashed scan are recovered first
+    results_writer = ResultsWriter(output_file, output_dir=output_dir, binary_store=binary_store)
+    results_writer.recover(ledger)
+    ledger.results_writer = results_writer
+
+    # directories are listed and filtered in a separate thread, while the files already found are processed
+    file_paths = iter_in_thread(get_file_paths(init_directory, ignore_extension=ignore_extension,
+                                               no_recursive_search=no_recursive_search, ledger=ledger,
+                                               process_all=process_all, retry_quarantined=retry_quarantined,
+                                               include_zip=include_zip))
+
+    text_cache = None if cache_dir is None else TextCache(cache_dir, max_size=cache_size)
+
+    scan_stats = ScanStats(log_file=stats_log)
 
-def process_file(file_path, output_file, output_dir):
     try:
-        row, report_type, columns = pdf_to_qa_result(file_path)  # process file
-    except Exception as e:
-        print(str(e))
+        if jobs > 1 or timeout is not None or memory_limit is not None:
+            # results are returned in the same order as a single process scan
+            pool = SupervisedPool(processes=jobs, timeout=timeout, memory_limit=memory_limit,
+                                  cleanup=close_open_archive)
+            worker = partial(get_qa_result, text_cache=text_cache)
+            for result in pool.imap(worker, file_paths, on_failure=get_failed_qa_result):
+                write_qa_result(result, results_writer, ledger=ledger)
+                scan_stats.add(result)
+            if text_cache is not None:
+                text_cache.evict(rescan=True)  # worker processes do not share their index with each other
+        else:
+            for file_path in file_paths:
+                result = get_qa_result(file_path, text_cache=text_cache)
+                write_qa_result(result, results_writer, ledger=ledger)
+                scan_stats.add(result)
+    finally:
+        close_open_archive()
+        results_writer.close()
+        ledger.close()
+        scan_stats.close()
+
+    if scan_stats.file_count:
+        scan_stats.print_summary()
+
+
+def process_file(file_path, output_file, output_dir):
+    results_writer = ResultsWriter(output_file, output_dir=output_dir)
+    write_qa_result(get_qa_result(file_path), results_writer)
+    results_writer.close()
+
+
+def write_qa_result(result, results_writer, ledger=None):
+    """
+    Write the output of get_qa_result to the results csv associated with its report type
+    :param result: output from get_qa_result
+    :type result: dict
+    :param results_writer: writer of the results csv files
+    :type results_writer: ResultsWriter
+    :param ledger: if provided, the file will be recorded as processed unless an exception occurred, or quarantined
+                   if the failure is in QUARANTINE_FAILURES
+    :type ledger: ProcessedFileLedger
+    """
+    start_time = time()
+    file_path, qa_result, error = result['file_path'], result['qa_result'], result['error']
+    if qa_result is None:
+        if error:
+            print(error)
+        if ledger is not None and result['failure'] in QUARANTINE_FAILURES:
+            ledger.quarantine(file_path, result['failure'])
+            print('Quarantined: %s' % file_path)
+        elif ledger is not None and not error:  # not a report, checked again if the file or the classifier changes
+            ledger.add(file_path, not_a_report=True)
         print('Skipping: %s' % file_path)
-        return
-        
-    current_file = "%s_%s" % (report_type, output_file)  # prepend report type to file name
-    if output_dir:
-        current_file = join(output_dir, current_file)
-    if row:
-        if not isfile(current_file):  # if file doesn't exist, need to write columns
-            with open(current_file, 'w') as csv:
-                csv.write(DELIMITER.join(columns) + '\n')
-        with open(current_file, "a") as csv:  # write the processed data
-            csv.write(row + '\n')
-        print("Processed: %s" % file_path)
+    else:
+        row, report_type, columns = qa_result
+        if row:
+            results_file = results_writer.get_file_path(report_type)
+            is_update = ledger is not None and ledger.get_results_file(file_path) == ledger.get_key(results_file)
+            results_writer.write(report_type, columns, row, updated_file_path=[None, file_path][is_update])
+            if ledger is not None:
+                ledger.add(file_path, report_type, results_file)
+            print("Processed: %s" % file_path)
+    result['stats']['write'] = time() - start_time
 
 
 def main():
@@ -152,6 +414,76 @@ def main():
                             dest='websocket_origin',
                             help='Allow a websocket origin other than localhost, see bokeh documentation',
                             default=None)
+    cmd_parser.add_argument('-j', '--jobs',
+                            dest='jobs',
+                            help='Number of processes used to scan pdf files, default is 1',
+                            default=1,
+                            type=int)
+    cmd_parser.add_argument('-cd', '--cache-dir',
+                            dest='cache_dir',
+                            help='Cache text extracted from pdf files in this directory to speed up future scans',
+                            default=None)
+    cmd_parser.add_argument('-cs', '--cache-size',
+                            dest='cache_size',
+                            help='Maximum size of the text cache in MB, default is 1024',
+                            default=1024,
+                            type=float)
+    cmd_parser.add_argument('-bs', '--binary-store',
+                            dest='binary_store',
+                            help='Also save results as .npy files, which load faster in the trending dashboard',
+                            default=False,
+                            action='store_true')
+    cmd_parser.add_argument('-c', '--canonical',
+                            dest='canonical',
+                            help='Add results to <report_type>_results_canonical.csv rather than a new time-stamped '
+                                 'file, rows of re-processed reports are replaced',
+                            default=False,
+                            action='store_true')
+    cmd_parser.add_argument('-sl', '--stats-log',
+                            dest='stats_log',
+                            help='Write stage durations, bytes, pages, and failure reason of each file to this '
+                                 'JSON-lines file',
+                            default=None)
+    cmd_parser.add_argument('-t', '--timeout',
+                            dest='timeout',
+                            help='Maximum seconds to process a file, files exceeding this are quarantined and skipped '
+                                 'by later scans',
+                            default=None,
+                            type=float)
+    cmd_parser.add_argument('-ml', '--memory-limit',
+                            dest='memory_limit',
+                            help='Maximum memory in MB of each worker process, files exceeding this are quarantined',
+                            default=None,
+                            type=float)
+    cmd_parser.add_argument('-rq', '--retry-quarantined',
+                            dest='retry_quarantined',
+                            help='Process files quarantined by a previous scan',
+                            default=False,
+                            action='store_true')
+    cmd_parser.add_argument('-z', '--include-zip',
+                            dest='include_zip',
+                            help='Also process pdf files in zip files, without extracting them to disk',
+                            default=False,
+                            action='store_true')
+    cmd_parser.add_argument('-mp', '--max-plot-points',
+                            dest='max_plot_points',
+                            help='Maximum number of points in view sent to the trending dashboard plots, dense data '
+                                 'is downsampled and refined when zooming in, e.g., %s' % MAX_PLOT_POINTS,
+                            default=None,
+                            type=int)
+    cmd_parser.add_argument('-li', '--live-interval',
+                            dest='live_interval',
+                            help='Check the results file of the Delta4 trending dashboard for new rows every this many '
+                                 'seconds, new rows are added without reloading the dashboard',
+                            default=None,
+                            type=float)
+    cmd_parser.add_argument('-tf', '--trend-file',
+                            dest='trend_files',
+                            help='Another results csv served by the same trending dashboard server, e.g., a '
+                                 'sncpatient results file along with a delta4 results file. May be used more '
+                                 'than once.',
+                            default=[],
+                            action='append')
     cmd_parser.add_argument('file_path', nargs='?',
                             help='Initiate scan if directory, launch dashboard if results file')
     args = cmd_parser.parse_args()
@@ -171,20 +503,14 @@ def main():
 
     if not isdir(path):
         if isfile(path) and splitext(path)[1].lower() == '.csv':
-            if basename(path).startswith('delta4_results_'):
-                trend_path = join(SCRIPT_DIR, 'trending.py')
-            elif basename(path).startswith('sncpatient_results_'):
-                trend_path = join(SCRIPT_DIR, 'trending_arccheck.py')
-            else:
-                print('Did you provide an IQDM results csv?')
-                return
+            from IQDM.server import serve  # bokeh is only imported to launch the trending dashboard
             try:
-                day_first = ['false', 'true'][args.day_first]  # must pass a string in subprocess.run()iq
-                cmd = ['bokeh', 'serve', trend_path, '--port', args.port]
-                if args.websocket_origin:
-                    cmd.extend(['--allow-websocket-origin', args.websocket_origin])
-                cmd.extend(['--args', path, day_first])
-                subprocess.run(cmd)
+                serve([path] + args.trend_files,
+                      port=args.port,
+                      websocket_origin=args.websocket_origin,
+                      day_first=args.day_first,
+                      max_plot_points=args.max_plot_points,
+                      live_interval=args.live_interval)
             except KeyboardInterrupt:
                 pass
 
@@ -204,7 +530,17 @@ def main():
                   output_dir=args.output_dir,
                   no_recursive_search=args.no_recursive_search,
                   process_all=args.process_all,
-                  results_dir=args.results_dir)
+                  results_dir=args.results_dir,
+                  jobs=max(1, args.jobs),
+                  cache_dir=args.cache_dir,
+                  cache_size=int(args.cache_size * 1024 ** 2),
+                  binary_store=args.binary_store,
+                  canonical=args.canonical,
+                  stats_log=args.stats_log,
+                  timeout=args.timeout,
+                  memory_limit=None if args.memory_limit is None else int(args.memory_limit * 1024 ** 2),
+                  retry_quarantined=args.retry_quarantined,
+                  include_zip=args.include_zip)
 
     if args.print_version:
         print('IMRT-QA-Data-Miner: IQDM v%s' % CURRENT_VERSION)
@@ -7,6 +7,7 @@ Created on Thu May 30 2019
 
 from IQDM.utilities import are_all_strings_in_text, get_csv
 from dateutil.parser import parse as date_parser
+from bisect import bisect_right
 
 
 # So far I've only come across Composite and Fraction as beam name place holders for the composite row
@@ -27,6 +28,10 @@ class Delta4Report:
                         'Gamma Dist Criteria', 'Beam Count']
         self.identifiers = ['ScandiDos AB', 'Treatment Summary', 'Acceptance Limits', 'Daily corr',
                             'Selected Detectors', 'Parameter Definitions & Acceptance Criteria, Detectors']
+        self.preview_identifiers = ['ScandiDos AB', 'Treatment Summary']  # see ReportParser.is_candidate
+        self.max_pages = 2  # summary data is on the first page(s), remaining pages are per beam details and images
+        self.required_columns = ['Patient ID', 'Plan Date', 'Energy', 'Radiation Dev']  # see ReportParser
+        self.laparams = None  # default LAParams, see ReportParser
 
         self.treatment_summary_columns = ['Beam', 'Gantry', 'Energy', 'Daily Corr', 'Norm Dose',
                                           'Dev', 'DTA', 'Gamma-Index', 'Dose Dev']
@@ -34,9 +39,39 @@ class Delta4Report:
         self.index_start = {}
         self.index_end = {}
         self.text = None
+        self.text_data = None
+        self.line_offsets = []
+        self.line_index = {}
+        self.next_text_block = []
+
+    def index_text(self, text_data):
+        """
+        Split text_data into lines and build the look up tables used to find sections of the report, so each look up
+        is a dictionary access or a single str.find rather than a scan of the lines
+        :param text_data: output from convert_pdf_to_txt
+        :type text_data: str
+        """
+        self.text_data = text_data
+        self.text = text_data.split('\n')
+
+        self.line_offsets = []  # character offset of each line in text_data
+        self.line_index = {}  # line: index of its first occurrence
+        offset = 0
+        for i, row in enumerate(self.text):
+            self.line_offsets.append(offset)
+            offset += len(row) + 1
+            self.line_index.setdefault(row, i)
+
+        # index of the line after the next blank line, starting from each line
+        self.next_text_block = [None] * len(self.text)
+        next_text_block = None
+        for i in range(len(self.text) - 1, -1, -1):
+            if self.text[i].strip() == '':
+                next_text_block = i + 1
+            self.next_text_block[i] = next_text_block
 
     def process_data(self, text_data):
-        self.text = text_data.split('\n')
+        self.index_text(text_data)
 
         # Patient information
         if 'PRE-TREATMENT REPORT' in self.text[3]:
@@ -46,8 +81,8 @@ class Delta4Report:
             self.data['patient_name'] = self.text[2]
             self.data['patient_id'] = self.text[3]
         else:
-            if 'Treatment Summary' in self.text:
-                tx_sum_index = self.text.index('Treatment Summary')
+            if 'Treatment Summary' in self.line_index:
+                tx_sum_index = self.get_line_index('Treatment Summary')
                 self.data['patient_name'] = self.text[tx_sum_index-3]
                 self.data['patient_id'] = self.text[tx_sum_index-2]
             else:
@@ -152,8 +187,9 @@ class Delta4Report:
                             self.data['Energy'][i] = override
 
         # Gamma Criteria
-        self.index_start['Gamma Criteria'] = self.text.index('Parameter Definitions & Acceptance Criteria, Detectors')
-        self.index_start['Acceptance Limits'] = self.text.index('Acceptance Limits')
+        self.index_start['Gamma Criteria'] = \
+            self.get_line_index('Parameter Definitions & Acceptance Criteria, Detectors')
+        self.index_start['Acceptance Limits'] = self.get_line_index('Acceptance Limits')
         self.index_end['Gamma Criteria'] = self.index_start['Acceptance Limits'] - 1
         self.index_end['Acceptance Limits'] = self.get_index_of_next_text_block(self.index_start['Acceptance Limits']) - 1
 
@@ -203,17 +239,37 @@ class Delta4Report:
         return None
 
     def get_string_index_in_text(self, string, start_index=0):
-        for i, row in enumerate(self.text[start_index:]):
-            if string in row:
-                return i
-        return None
+        """
+        :param string: a string without line breaks
+        :type string: str
+        :param start_index: first line to search
+        :type start_index: int
+        :return: index of the first line containing string, relative to start_index, or None if not found
+        :rtype: int
+        """
+        if start_index >= len(self.text):
+            return None
+        position = self.text_data.find(string, self.line_offsets[start_index])
+        if position == -1:
+            return None
+        return bisect_right(self.line_offsets, position) - 1 - start_index
 
     def get_index_of_next_text_block(self, start_index):
-        for i, row in enumerate(self.text[start_index:]):
-            if row.strip() == '':
-                return i + start_index + 1
+        if start_index < len(self.next_text_block):
+            return self.next_text_block[start_index]
         return None
 
+    def get_line_index(self, line):
+        """
+        :param line: the complete text of a line
+        :type line: str
+        :return: index of the first line equal to line, raises ValueError if not found (same as list.index)
+        :rtype: int
+        """
+        if line not in self.line_index:
+            raise ValueError("'%s' is not in list" % line)
+        return self.line_index[line]
+
     def get_data_block(self, data_type):
         return self.text[self.index_start[data_type]:self.index_end[data_type]]
 
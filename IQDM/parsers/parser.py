@@ -5,13 +5,26 @@ Created on Thu May 30 2019
 @author: Dan Cutright, PhD
 """
 
-from IQDM.utilities import are_all_strings_in_text
 from IQDM.parsers.delta4 import Delta4Report
 from IQDM.parsers.sncpatient import SNCPatientReport
+from IQDM.utilities import DELIMITER, MISSING_VALUES
+from time import time
+import hashlib
+import re
 
-# These classes will be checked in ReportParser.get_report()
+# These classes will be checked in ReportParser.get_report(), use register_report_class() to add a new parser
 REPORT_CLASSES = [Delta4Report, SNCPatientReport]
 
+# Number of pages converted to text before ReportParser.is_candidate() is used to reject non-report pdfs
+PREVIEW_PAGE_COUNT = 1
+
+# Identifiers of a class without preview_identifiers found in a preview for the pdf to be a candidate of that class
+MIN_PREVIEW_IDENTIFIERS = 3
+
+# Increase if a change of the report classes may identify pdfs that were previously not reports, so the processed file
+# ledger checks them again (identifiers and registered classes are already part of ReportParser.get_classifier_version)
+CLASSIFIER_VERSION = 1
+
 
 class ReportParser:
     """
@@ -26,21 +39,241 @@ class ReportParser:
     This class also requires the following method:
         process_data(text_data):    processing the data does not occur until this is called
 
+    Optionally, a report class may define:
+        max_pages:      number of pages needed to identify and parse the report, only this many pages are converted
+                        to text if every class defines max_pages (see ReportClassifier.max_pages)
+        laparams:       dict of pdfminer LAParams keyword arguments used to convert the report to text, default
+                        LAParams are used if None (see ReportClassifier.get_laparams)
+        preview_identifiers:    distinctive identifiers (e.g., a header or title) on the first page, any of which
+                                makes a pdf a candidate of the class (see ReportParser.is_candidate). Otherwise,
+                                MIN_PREVIEW_IDENTIFIERS of the identifiers must be found on the first page.
+        required_columns:       columns that must have a value, if any is missing from text truncated to max_pages
+                                the pdf is converted again with every page (see ReportParser.missing_columns)
+
     If ReportParser.report is None, the input text was not identified to be any of the report classes listed in
     REPORT_CLASSES
     """
-    def __init__(self, text):
-        self.report = self.get_report(text)
+    def __init__(self, text, stats=None):
+        """
+        :param text: output from convert_pdf_to_txt
+        :type text: str
+        :param stats: optional dict, durations in seconds of 'classify', 'parse', and 'serialize' will be set
+        :type stats: dict
+        """
+        self.report = self.get_report(text, stats=stats)
+        self.missing_columns = []
         if self.report:
             self.columns = self.report.columns
+            start_time = time()
             self.csv = self.report.csv
+            if stats is not None:
+                stats['serialize'] = time() - start_time
             self.report_type = self.report.report_type
+            self.missing_columns = self.get_missing_columns()
+
+    def get_missing_columns(self):
+        """
+        :return: required_columns of the report without a value (see MISSING_VALUES in utilities.py)
+        :rtype: list
+        """
+        values = dict(zip(self.columns, self.csv.split(DELIMITER)))
+        return [column for column in getattr(self.report, 'required_columns', None) or []
+                if values.get(column, '').strip() in MISSING_VALUES]
+
+    @staticmethod
+    def get_report(text, stats=None):
+        stats = {} if stats is None else stats
+        start_time = time()
+        report_class = CLASSIFIER.get_report_class(text)
+        stats['classify'] = time() - start_time
+        if report_class is not None:
+            start_time = time()
+            rc = report_class()
+            rc.process_data(text)  # parse the text data
+            stats['parse'] = time() - start_time
+            return rc
+        return None
+
+    @staticmethod
+    def is_candidate(preview_text):
+        """
+        Quick check on the first page(s) of a pdf, so non-report pdfs can be rejected before converting every page.
+        Identifiers may be spread across multiple pages, so only the distinctive preview_identifiers of a class are
+        required (or MIN_PREVIEW_IDENTIFIERS of its identifiers), generic identifiers (e.g., 'Energy') are not enough.
+        :param preview_text: text of the first PREVIEW_PAGE_COUNT pages
+        :type preview_text: str
+        :return: False if preview_text is not a candidate of any class in REPORT_CLASSES
+        :rtype: bool
+        """
+        return CLASSIFIER.is_candidate(preview_text)
 
     @staticmethod
-    def get_report(text):
-        for report_class in REPORT_CLASSES:
+    def get_max_pages():
+        """
+        :return: number of pages to convert to text, None if all pages are needed
+        :rtype: int
+        """
+        return CLASSIFIER.max_pages
+
+    @staticmethod
+    def get_laparams(preview_text):
+        """
+        :param preview_text: text of the first PREVIEW_PAGE_COUNT pages, converted with default LAParams
+        :type preview_text: str
+        :return: keyword arguments of LAParams to convert the pdf with, None for default LAParams
+        :rtype: dict
+        """
+        return CLASSIFIER.get_laparams(preview_text)
+
+    @staticmethod
+    def get_laparams_profiles():
+        """
+        :return: every LAParams profile that get_laparams may return
+        :rtype: list
+        """
+        return CLASSIFIER.laparams_profiles
+
+    @staticmethod
+    def get_classifier_version():
+        """
+        :return: changes if the registered report classes, their identifiers, or CLASSIFIER_VERSION change, so pdfs
+                 found to not be a report can be checked again
+        :rtype: str
+        """
+        return CLASSIFIER.version
+
+
+class ReportClassifier:
+    """
+    Identifies the report class of a text with a single scan, regardless of the number of report classes. The
+    identifiers of every class are combined into one regular expression, with a lookahead so that overlapping
+    identifiers are all found.
+    """
+    def __init__(self, report_classes):
+        """
+        :param report_classes: report classes in order of priority, this list is modified by register()
+        :type report_classes: list
+        """
+        self.report_classes = report_classes
+        self.build()
+
+    def build(self):
+        self.identifiers = {}
+        self.preview_identifiers = {}
+        self.laparams = {}
+        max_pages = []
+        for report_class in self.report_classes:
             rc = report_class()  # initialize class to access identifiers
-            if are_all_strings_in_text(text, rc.identifiers):
-                rc.process_data(text)  # parse the text data
-                return rc
+            self.identifiers[report_class] = set(rc.identifiers)
+            self.preview_identifiers[report_class] = set(getattr(rc, 'preview_identifiers', None) or [])
+            self.laparams[report_class] = getattr(rc, 'laparams', None)
+            max_pages.append(getattr(rc, 'max_pages', None))
+        self.laparams_profiles = []
+        for profile in self.laparams.values():
+            if profile is not None and profile not in self.laparams_profiles:
+                self.laparams_profiles.append(profile)
+        all_identifiers = set().union(*self.identifiers.values(), *self.preview_identifiers.values())
+
+        # At a given position, the longest identifier is matched, so also record any identifiers it contains
+        self.implied_identifiers = {identifier: {other for other in all_identifiers if other in identifier}
+                                    for identifier in all_identifiers}
+
+        ordered_identifiers = sorted(all_identifiers, key=lambda x: (-len(x), x))
+        self.pattern = re.compile('(?=(%s))' % '|'.join([re.escape(identifier) for identifier in ordered_identifiers]))
+        self.identifier_count = len(all_identifiers)
+
+        # The report class is unknown until the text is converted, so use the most pages needed by any class
+        self.max_pages = None if not max_pages or None in max_pages else max(max_pages)
+
+        definition = [CLASSIFIER_VERSION, PREVIEW_PAGE_COUNT, MIN_PREVIEW_IDENTIFIERS, self.max_pages]
+        for report_class in self.report_classes:
+            definition.append([report_class.__module__, report_class.__name__,
+                               sorted(self.identifiers[report_class]), sorted(self.preview_identifiers[report_class])])
+        self.version = '%s.%s' % (CLASSIFIER_VERSION, hashlib.sha1(repr(definition).encode('utf-8')).hexdigest()[:12])
+
+    def register(self, report_class, index=None):
+        """
+        Add a report class to be checked by ReportParser
+        :param report_class: a report class meeting the requirements described in ReportParser
+        :param index: position in the priority order of report classes, default is last
+        :type index: int
+        """
+        if report_class not in self.report_classes:
+            self.report_classes.insert(len(self.report_classes) if index is None else index, report_class)
+            self.build()
+
+    def find_identifiers(self, text):
+        """
+        :param text: output from convert_pdf_to_text
+        :type text: str
+        :return: all identifiers found in text
+        :rtype: set
+        """
+        found = set()
+        for match in self.pattern.finditer(text):
+            found.update(self.implied_identifiers[match.group(1)])
+            if len(found) == self.identifier_count:
+                break
+        return found
+
+    def get_report_class(self, text):
+        """
+        :param text: output from convert_pdf_to_text
+        :type text: str
+        :return: the first report class with all of its identifiers found in text, None if no match
+        """
+        found = self.find_identifiers(text)
+        for report_class in self.report_classes:
+            if self.identifiers[report_class].issubset(found):
+                return report_class
         return None
+
+    def get_candidate_classes(self, preview_text):
+        """
+        :param preview_text: text of the first page(s) of a pdf
+        :type preview_text: str
+        :return: report classes the pdf may be, see ReportParser.is_candidate
+        :rtype: list
+        """
+        found = self.find_identifiers(preview_text)
+        candidates = []
+        for report_class in self.report_classes:
+            if self.preview_identifiers[report_class]:
+                if self.preview_identifiers[report_class] & found:
+                    candidates.append(report_class)
+            elif len(self.identifiers[report_class] & found) >= min(MIN_PREVIEW_IDENTIFIERS,
+                                                                    len(self.identifiers[report_class])):
+                candidates.append(report_class)
+        return candidates
+
+    def is_candidate(self, text):
+        return bool(self.get_candidate_classes(text))
+
+    def get_laparams(self, preview_text):
+        """
+        The report class is unknown until every page is converted, so a layout profile is only used if it is shared
+        by every candidate class of the preview text
+        :param preview_text: text of the first page(s) of a pdf
+        :type preview_text: str
+        :return: keyword arguments of LAParams, None for default LAParams
+        :rtype: dict
+        """
+        if not self.laparams_profiles:
+            return None
+        profiles = [self.laparams[report_class] for report_class in self.get_candidate_classes(preview_text)]
+        if profiles and all([profile == profiles[0] for profile in profiles]):
+            return profiles[0]
+        return None
+
+
+CLASSIFIER = ReportClassifier(REPORT_CLASSES)
+
+
+def register_report_class(report_class, index=None):
+    """
+    Add a new parser class to REPORT_CLASSES, see ReportParser for the requirements of report_class
+    :param report_class: the report class to be registered
+    :param index: position in the priority order of report classes, default is last
+    :type index: int
+    """
+    CLASSIFIER.register(report_class, index=index)
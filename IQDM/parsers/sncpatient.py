@@ -17,6 +17,10 @@ class SNCPatientReport:
                         'Threshold (%)', 'Meas Uncertainty', 'Analysis Type', 'Total Points', 'Passed', 'Failed',
                         '% Passed', 'Min', 'Max', 'Average', 'Std Dev', 'X offset (mm)', 'Y offset (mm)', 'Notes']
         self.identifiers = ['QA File Parameter', 'Threshold', 'Notes', 'Reviewed By :', 'SSD', 'Depth', 'Energy']
+        self.preview_identifiers = ['QA File Parameter', 'Reviewed By :']  # see ReportParser.is_candidate
+        self.max_pages = 2
+        self.required_columns = ['Patient ID', 'Plan Date', '% Passed']  # see ReportParser
+        self.laparams = None  # default LAParams, see ReportParser
         self.text = None
         self.data = {}
 
@@ -9,31 +9,108 @@ from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
 from pdfminer.converter import TextConverter
 from pdfminer.layout import LAParams
 from pdfminer.pdfpage import PDFPage
+from itertools import islice
+from time import time
+from os import fstat
+from IQDM.utilities import split_zip_member_path, read_file_data
 try:
-    from io import StringIO
+    from io import StringIO, BytesIO
 except ImportError:
     from cStringIO import StringIO  # python 2
+    from cStringIO import StringIO as BytesIO
 
 
-def convert_pdf_to_txt(path):
+def convert_pdf_to_txt(path, text_cache=None, preview_filter=None, preview_page_count=1, max_pages=None,
+                       laparams_selector=None, laparams_profiles=None, stats=None):
+    """
+    :param path: absolute file path of the pdf, or a zip member path (see utilities.get_zip_member_paths)
+    :param text_cache: optional cache of previously extracted text
+    :type text_cache: TextCache
+    :param preview_filter: optional function of the text of the first preview_page_count pages, if it returns False
+                           the remaining pages are not converted and None is returned
+    :type preview_filter: callable
+    :param preview_page_count: number of pages passed to preview_filter
+    :type preview_page_count: int
+    :param max_pages: stop converting after this many pages, convert all pages if None
+    :type max_pages: int
+    :param laparams_selector: optional function of the preview text returning keyword arguments of LAParams, the pdf
+                              is converted again with these parameters if they differ from the defaults
+    :type laparams_selector: callable
+    :param laparams_profiles: every value laparams_selector may return, used for the text_cache key
+    :type laparams_profiles: list
+    :param stats: optional dict, 'extract' (seconds), 'bytes', 'pages' (converted), and 'cache_hit' will be set
+    :type stats: dict
+    :return: text extracted from the pdf, None if rejected by preview_filter
+    :rtype: str
+    """
+    start_time = time()
+    stats = {} if stats is None else stats
+    stats['pages'] = 0
+    stats['cache_hit'] = False
+    laparams = LAParams()
+
+    if text_cache is None and split_zip_member_path(path)[1] is None:
+        with open(path, 'rb') as fp:
+            stats['bytes'] = fstat(fp.fileno()).st_size
+            text = convert_pdf_file_to_txt(fp, laparams, preview_filter, preview_page_count, max_pages,
+                                           laparams_selector, stats)
+    else:  # the pdf content is needed for the cache key, and zip members are only read into memory
+        pdf_data = read_file_data(path)
+        stats['bytes'] = len(pdf_data)
+        key = None if text_cache is None else text_cache.get_key(pdf_data, laparams, max_pages, laparams_profiles)
+        text = None if key is None else text_cache.get(key)
+        stats['cache_hit'] = text is not None
+        if text is None:
+            text = convert_pdf_file_to_txt(BytesIO(pdf_data), laparams, preview_filter, preview_page_count,
+                                           max_pages, laparams_selector, stats)
+            if text is not None and key is not None:
+                text_cache.set(key, text)
+
+    stats['extract'] = time() - start_time
+    return text
+
+
+def convert_pdf_file_to_txt(fp, laparams, preview_filter=None, preview_page_count=1, max_pages=None,
+                            laparams_selector=None, stats=None):
+    pages = iter_pdf_file_pages_to_txt(fp, laparams, max_pages, stats)
+    text = ''.join(islice(pages, preview_page_count))
+    if preview_filter is not None and not preview_filter(text):
+        pages.close()
+        return None
+    if laparams_selector is not None:
+        profile = laparams_selector(text)
+        if profile is not None and vars(LAParams(**profile)) != vars(laparams):
+            # preview pages must be converted again so every page uses the same layout analysis
+            pages.close()
+            fp.seek(0)
+            return ''.join(iter_pdf_file_pages_to_txt(fp, LAParams(**profile), max_pages, stats))
+    return text + ''.join(pages)
+
+
+def iter_pdf_file_pages_to_txt(fp, laparams, max_pages=None, stats=None):
+    """
+    Generator of the text of each page, joining the output is identical to converting the whole document at once
+    :param max_pages: stop after this many pages, all pages if None
+    :param stats: optional dict, stats['pages'] is incremented for each page converted
+    """
     rsrcmgr = PDFResourceManager()
     retstr = StringIO()
-    laparams = LAParams()
     device = TextConverter(rsrcmgr, retstr, laparams=laparams)
-    fp = open(path, 'rb')
     interpreter = PDFPageInterpreter(rsrcmgr, device)
     password = ""
-    maxpages = 0
+    maxpages = max_pages or 0
     caching = True
     pagenos = set()
 
-    for page in PDFPage.get_pages(fp, pagenos, maxpages=maxpages, password=password, caching=caching,
-                                  check_extractable=True):
-        interpreter.process_page(page)
-
-    text = retstr.getvalue()
-
-    fp.close()
-    device.close()
-    retstr.close()
-    return text
+    try:
+        for page in PDFPage.get_pages(fp, pagenos, maxpages=maxpages, password=password, caching=caching,
+                                      check_extractable=True):
+            interpreter.process_page(page)
+            if stats is not None:
+                stats['pages'] = stats.get('pages', 0) + 1
+            yield retstr.getvalue()
+            retstr.seek(0)
+            retstr.truncate(0)
+    finally:
+        device.close()
+        retstr.close()
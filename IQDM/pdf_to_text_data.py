@@ -15,13 +15,14 @@ from pdfminer.pdfdevice import PDFDevice
 from pdfminer.layout import LAParams
 from pdfminer.converter import PDFPageAggregator
 import pdfminer
+from bisect import bisect_left, bisect_right
 
 
 class CustomPDFParser:
-    def __init__(self, file_path, verbose=False):
+    def __init__(self, file_path, verbose=False, max_pages=None):
         self.page = []
         self.file_path = file_path
-        self.convert_pdf_to_text(verbose=verbose)
+        self.convert_pdf_to_text(verbose=verbose, max_pages=max_pages)
         self.data = []
 
     def print(self):
@@ -38,7 +39,7 @@ class CustomPDFParser:
     def get_block_data_with_y(self, page, y):
         return self.page[page].get_block_data_with_y(y)
 
-    def convert_pdf_to_text(self, verbose=False):
+    def convert_pdf_to_text(self, verbose=False, max_pages=None):
 
         # Open a PDF file.
         fp = open(self.file_path, 'rb')
@@ -72,6 +73,8 @@ class CustomPDFParser:
 
         # loop over all pages in the document
         for p, page in enumerate(PDFPage.create_pages(document)):
+            if max_pages and p >= max_pages:
+                break
             # read the page into a layout object
             interpreter.process_page(page)
             layout = device.get_result()
@@ -88,8 +91,10 @@ class PDFPageParser:
         self.verbose = verbose
 
         self.parse_obj(lt_objs)
-        self.sort_all_data_by_y()
-        self.sub_sort_all_data_by_x()
+        self.sort_all_data_by_y_then_x()
+
+        # int(y) of each block, negated so it is ascending for bisect
+        self.y_index = [-int(y) for y in self.data['y']]
 
     def parse_obj(self, lt_objs):
         # loop over the object list
@@ -109,19 +114,13 @@ class PDFPageParser:
     def sort_all_data_by_y(self):
         self.sort_all_data('y', reverse=True)
 
-    def sub_sort_all_data_by_x(self):
-        for y in set(self.data['y']):
-            # for a given y, collect all indices, y, and text values with given y
-            indices, x, text = [], [], []
-            for i, y_ in enumerate(self.data['y']):
-                if y_ == y:
-                    indices.append(i)
-                    x.append(self.data['x'][i])
-                    text.append(self.data['text'][i])
-
-            for sort_index, data_index in enumerate(self.get_sorted_indices(x)):
-                self.data['x'][indices[sort_index]] = x[data_index]
-                self.data['text'][indices[sort_index]] = text[data_index]
+    def sort_all_data_by_y_then_x(self):
+        """
+        Top to bottom, then left to right (blocks with the same y are sorted by x)
+        """
+        sorted_indices = sorted(range(len(self.data['y'])), key=lambda i: (-self.data['y'][i], self.data['x'][i]))
+        for key in list(self.data):
+            self.data[key] = [self.data[key][i] for i in sorted_indices]
 
     def sort_all_data(self, sort_key, reverse=False):
         sorted_indices = self.get_sorted_indices(self.data[sort_key], reverse=reverse)
@@ -150,13 +149,18 @@ class PDFPageParser:
         return coord[0], coord[1], self.data['text'][index]
 
     def get_block_data_with_y(self, y, exact=False):
+        """
+        :param y: y coordinate
+        :param exact: if True, only return blocks with int(y) equal to y, otherwise within a tolerance of 20
+        :type exact: bool
+        :return: text of the matching blocks, in data order
+        :rtype: list
+        """
         tolerance = 20
-        block_data = []
-        for i, data in enumerate(self.data['text']):
-            if exact:
-                if int(self.data['y'][i]) == y:
-                    block_data.append(data)
-            else:
-                if y + tolerance > int(self.data['y'][i]) > y - tolerance:
-                    block_data.append(data)
-        return block_data
+        if exact:
+            start = bisect_left(self.y_index, -y)
+            end = bisect_right(self.y_index, -y)
+        else:  # exclusive of the tolerance
+            start = bisect_right(self.y_index, -y - tolerance)
+            end = bisect_left(self.y_index, -y + tolerance)
+        return self.data['text'][start:end]
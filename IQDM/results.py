@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Writers for the results csv files created by process_files
+Created on Sat Oct 17 2026
+@author: Dan Cutright, PhD
+"""
+
+from os.path import join, isfile, splitext
+from os import fsync, replace, listdir, remove
+from time import time
+import io
+from IQDM.utilities import DELIMITER, update_binary_results
+from IQDM.ledger import ProcessedFileLedger
+
+
+FLUSH_ROW_COUNT = 500  # rows written per report type before the buffer is flushed
+FLUSH_INTERVAL = 30.  # seconds between buffer flushes
+BUFFER_SIZE = 1024 ** 2  # bytes
+CANONICAL_OUTPUT_FILE = 'results_canonical.csv'  # output_file used by process_files(canonical=True)
+TEMP_EXTENSION = '.tmp'  # new results files are written to <file_path>.tmp until the scan is complete
+
+
+class ResultsWriter:
+    """
+    Keeps one buffered file handle open per report type for the duration of a scan. New results files are written to a
+    temporary file, which is fsynced and renamed to <report_type>_<output_file> by close(). If the results file already
+    exists (e.g., a user specified output_file or CANONICAL_OUTPUT_FILE), rows are appended to it instead, and rows of
+    reports already in the file are replaced by the new row when closed. Optionally, a binary copy of each results
+    file is updated once the csv is complete (see utilities.update_binary_results).
+
+    If a ledger is used, set ledger.results_writer so rows are fsynced before the ledger commits their files, and call
+    recover() before the scan so temporary files left by a scan that did not finish are not lost.
+    """
+    def __init__(self, output_file, output_dir=None, flush_row_count=FLUSH_ROW_COUNT, flush_interval=FLUSH_INTERVAL,
+                 binary_store=False):
+        """
+        :param output_file: output file name, report type will be prepended to this value
+        :type output_file: str
+        :param output_dir: user specified output directory, default value is to local directory
+        :type output_dir: str
+        :param flush_row_count: flush a file after this many rows have been written to it
+        :type flush_row_count: int
+        :param flush_interval: flush all files if this many seconds have passed since the last flush
+        :type flush_interval: float
+        :param binary_store: if True, write a memory-mappable .npy copy of each results file when closed
+        :type binary_store: bool
+        """
+        self.output_file = output_file
+        self.output_dir = output_dir
+        self.flush_row_count = flush_row_count
+        self.flush_interval = flush_interval
+        self.binary_store = binary_store
+
+        self.files = {}  # report_type: {'file_path': str, 'temp_path': str or None, 'handle': file, 'rows': int}
+        self.last_flush = time()
+
+    def get_file_path(self, report_type):
+        current_file = "%s_%s" % (report_type, self.output_file)  # prepend report type to file name
+        if self.output_dir:
+            current_file = join(self.output_dir, current_file)
+        return current_file
+
+    def open(self, report_type, columns):
+        file_path = self.get_file_path(report_type)
+        if isfile(file_path):
+            temp_path = None
+            remove_partial_row(file_path)
+            handle = open(file_path, 'a', buffering=BUFFER_SIZE)
+        else:  # if file doesn't exist, need to write columns
+            temp_path = file_path + TEMP_EXTENSION
+            handle = open(temp_path, 'w', buffering=BUFFER_SIZE)
+            handle.write(DELIMITER.join(columns) + '\n')
+        self.files[report_type] = {'file_path': file_path, 'temp_path': temp_path, 'handle': handle, 'rows': 0,
+                                   'updated': set()}
+
+    def write(self, report_type, columns, row, updated_file_path=None):
+        """
+        :param report_type: report_type property of the parser class
+        :type report_type: str
+        :param columns: columns property of the parser class
+        :type columns: list
+        :param row: csv row, delimited with DELIMITER
+        :type row: str
+        :param updated_file_path: if the report of this row is already in the results file, provide its file path so
+                                  the previous row is removed by close()
+        :type updated_file_path: str
+        """
+        if report_type not in self.files:
+            self.open(report_type, columns)
+
+        current_file = self.files[report_type]
+        current_file['handle'].write(row + '\n')
+        current_file['rows'] += 1
+        if updated_file_path is not None:
+            current_file['updated'].add(ProcessedFileLedger.get_key(updated_file_path))
+
+        if current_file['rows'] >= self.flush_row_count:
+            self.flush(report_type)
+        elif time() - self.last_flush > self.flush_interval:
+            self.flush()
+
+    def flush(self, report_type=None):
+        """
+        :param report_type: flush only the file of this report_type, flush all files if None
+        :type report_type: str
+        """
+        report_types = list(self.files) if report_type is None else [report_type]
+        for key in report_types:
+            self.files[key]['handle'].flush()
+            self.files[key]['rows'] = 0
+        if report_type is None:
+            self.last_flush = time()
+
+    def sync(self):
+        """
+        Flush and fsync every open results file, so rows written so far are kept if the process crashes
+        """
+        for current_file in self.files.values():
+            current_file['handle'].flush()
+            fsync(current_file['handle'].fileno())
+            current_file['rows'] = 0
+        self.last_flush = time()
+
+    def recover(self, ledger):
+        """
+        Merge the temporary results files left by a scan that did not finish (e.g., a crash) into their results files.
+        Only rows of files committed to the ledger are kept, other files are not in the ledger and are processed again.
+        :param ledger: the ledger of the scan that created the temporary files
+        :type ledger: ProcessedFileLedger
+        """
+        directory = self.output_dir or '.'
+        for file_name in listdir(directory):
+            file_path, ext = splitext(join(directory, file_name))
+            if ext == TEMP_EXTENSION and ('_results_' in file_path and splitext(file_path)[1].lower() == '.csv' or
+                                          file_path.endswith('_%s' % self.output_file)):
+                recover_temp_file(file_path, ledger)
+
+    def close(self):
+        for current_file in self.files.values():
+            handle = current_file['handle']
+            handle.flush()
+            fsync(handle.fileno())
+            handle.close()
+            if current_file['temp_path'] is not None:
+                replace(current_file['temp_path'], current_file['file_path'])
+            if current_file['updated']:
+                remove_replaced_rows(current_file['file_path'], current_file['updated'])
+            if self.binary_store:
+                update_binary_results(current_file['file_path'])
+        self.files = {}
+
+
+def get_row_file_path(line, column_count):
+    """
+    :param line: a row of a results csv
+    :type line: str
+    :param column_count: number of columns in the header, the file path is the last column and may contain DELIMITER
+    :type column_count: int
+    :return: normalized file path of the report of the row (see ProcessedFileLedger.get_key), None if empty
+    :rtype: str
+    """
+    file_path = DELIMITER.join(line.split(DELIMITER)[column_count:]).strip()
+    return ProcessedFileLedger.get_key(file_path) if file_path else None
+
+
+def remove_partial_row(file_path):
+    """
+    Truncate a row left incomplete by a crash, so appended rows start on a new line
+    :param file_path: results csv file
+    :type file_path: str
+    """
+    with open(file_path, 'rb+') as doc:
+        end = position = doc.seek(0, 2)
+        while position > 0:  # only the end of the file is read, back to its last new line
+            start = max(0, position - BUFFER_SIZE)
+            doc.seek(start)
+            chunk = doc.read(position - start)
+            if position == end and chunk.endswith(b'\n'):
+                return
+            if b'\n' in chunk:
+                doc.truncate(start + chunk.rfind(b'\n') + 1)
+                return
+            position = start
+
+
+def recover_temp_file(results_file, ledger):
+    """
+    :param results_file: results csv file, its temporary file is results_file + TEMP_EXTENSION
+    :type results_file: str
+    :param ledger: only rows of files recorded in the ledger as processed into results_file are recovered
+    :type ledger: ProcessedFileLedger
+    """
+    temp_path = results_file + TEMP_EXTENSION
+    with io.open(temp_path, 'r', encoding='utf-8', errors='surrogateescape') as doc:
+        lines = doc.read().split('\n')
+    lines.pop()  # empty if the file ends with a new line, otherwise a row left incomplete by the crash
+
+    results_key = ProcessedFileLedger.get_key(results_file)
+    rows = []
+    if lines:
+        column_count = len(lines[0].split(DELIMITER))
+        for line in lines[1:]:
+            file_path = get_row_file_path(line, column_count)
+            if file_path is not None and ledger.is_processed(file_path) and \
+                    ledger.get_results_file(file_path) == results_key:
+                rows.append(line)
+
+    if not rows:
+        remove(temp_path)
+        return
+
+    if isfile(results_file):  # e.g., created by a later scan with the same output_file
+        remove_partial_row(results_file)
+        with io.open(results_file, 'a', encoding='utf-8', errors='surrogateescape') as doc:
+            doc.write('\n'.join(rows) + '\n')
+            doc.flush()
+            fsync(doc.fileno())
+        remove(temp_path)
+    else:
+        with io.open(temp_path, 'w', encoding='utf-8', errors='surrogateescape') as doc:
+            doc.write('\n'.join([lines[0]] + rows) + '\n')
+            doc.flush()
+            fsync(doc.fileno())
+        replace(temp_path, results_file)
+    print('Recovered %s rows of an incomplete scan in %s' % (len(rows), results_file))
+
+
+def remove_replaced_rows(results_file, file_paths):
+    """
+    Keep only the last row of each report in file_paths, rows of other reports are not changed
+    :param results_file: results csv file
+    :type results_file: str
+    :param file_paths: normalized file paths (see ProcessedFileLedger.get_key) of the updated reports
+    :type file_paths: set
+    """
+    # surrogateescape so that lines are written back byte for byte, regardless of the encoding of the results file
+    with io.open(results_file, 'r', encoding='utf-8', errors='surrogateescape') as doc:
+        lines = doc.read().splitlines()
+    header = lines.pop(0)
+    column_count = len(header.split(DELIMITER))
+
+    found = set()
+    keep = [True] * len(lines)
+    for i in range(len(lines) - 1, -1, -1):  # newest rows are at the end of the file
+        key = get_row_file_path(lines[i], column_count)
+        if key in file_paths:
+            keep[i] = key not in found
+            found.add(key)
+
+    if all(keep):  # no previous row found, e.g., removed by the user
+        return
+
+    temp_path = results_file + '.replace' + TEMP_EXTENSION  # not mistaken for a results file by recover()
+    with io.open(temp_path, 'w', encoding='utf-8', errors='surrogateescape') as doc:
+        doc.write(header + '\n')
+        for line, keep_line in zip(lines, keep):
+            if keep_line:
+                doc.write(line + '\n')
+        doc.flush()
+        fsync(doc.fileno())
+    replace(temp_path, results_file)
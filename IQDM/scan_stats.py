@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Per-file stage durations and counters collected during process_files
+Created on Sat Oct 17 2026
+@author: Dan Cutright, PhD
+"""
+
+from __future__ import print_function
+from collections import Counter
+import heapq
+import json
+import numpy as np
+
+
+STAGES = ['extract', 'classify', 'parse', 'serialize', 'write']
+SLOWEST_FILE_COUNT = 10  # number of files listed in the summary
+
+
+def get_initial_stats():
+    """
+    :return: the initial value of the stats of a file, see main.get_qa_result
+    :rtype: dict
+    """
+    return {'bytes': None, 'pages': 0, 'cache_hit': False}
+
+
+class ScanStats:
+    """
+    Collects the stats of every file scanned by process_files, see main.get_qa_result. Stage durations are summarized
+    with their 50th and 95th percentiles and maximum, and each file may be written as a line of a JSON-lines log.
+    """
+    def __init__(self, log_file=None, slowest_file_count=SLOWEST_FILE_COUNT):
+        """
+        :param log_file: optional file path of a JSON-lines log, one line per file followed by a summary line
+        :type log_file: str
+        :param slowest_file_count: number of the slowest files to keep for the summary
+        :type slowest_file_count: int
+        """
+        self.log = None if log_file is None else open(log_file, 'w')
+        self.slowest_file_count = slowest_file_count
+
+        self.durations = {stage: [] for stage in STAGES}
+        self.failures = Counter()
+        self.slowest_files = []  # heap of (total duration, file_path)
+        self.file_count = 0
+        self.byte_count = 0
+        self.page_count = 0
+        self.cache_hit_count = 0
+
+    def add(self, result):
+        """
+        :param result: output from get_qa_result, with the 'write' stage optionally added to result['stats']
+        :type result: dict
+        """
+        stats = result['stats']
+        total = 0.
+        for stage in STAGES:
+            if stats.get(stage) is not None:
+                self.durations[stage].append(stats[stage])
+                total += stats[stage]
+
+        self.file_count += 1
+        self.byte_count += stats['bytes'] or 0
+        self.page_count += stats['pages']
+        self.cache_hit_count += stats['cache_hit']
+        if result['failure'] is not None:
+            self.failures[result['failure']] += 1
+
+        if len(self.slowest_files) < self.slowest_file_count:
+            heapq.heappush(self.slowest_files, (total, result['file_path']))
+        elif self.slowest_files and total > self.slowest_files[0][0]:
+            heapq.heapreplace(self.slowest_files, (total, result['file_path']))
+
+        if self.log is not None:
+            record = {'file_path': result['file_path'], 'failure': result['failure'], 'error': result['error'],
+                      'total': total}
+            record.update(stats)
+            self.log.write(json.dumps(record) + '\n')
+
+    def get_summary(self):
+        """
+        :return: counters, percentiles of each stage duration in seconds, and the slowest files
+        :rtype: dict
+        """
+        stages = {}
+        for stage, durations in self.durations.items():
+            if durations:
+                p50, p95 = np.percentile(durations, [50, 95])
+                stages[stage] = {'count': len(durations), 'total': float(sum(durations)),
+                                 'p50': float(p50), 'p95': float(p95), 'max': float(max(durations))}
+        return {'files': self.file_count,
+                'bytes': self.byte_count,
+                'pages': self.page_count,
+                'cache_hits': self.cache_hit_count,
+                'failures': dict(self.failures),
+                'stages': stages,
+                'slowest_files': [{'file_path': file_path, 'total': total}
+                                  for total, file_path in sorted(self.slowest_files, reverse=True)]}
+
+    def print_summary(self):
+        summary = self.get_summary()
+        print('Scanned %s file(s), %0.1f MB, %s page(s) converted, %s text cache hit(s)' %
+              (summary['files'], summary['bytes'] / 1024. ** 2, summary['pages'], summary['cache_hits']))
+        if summary['stages']:
+            print('%-10s %10s %10s %10s %10s' % ('stage', 'total s', 'p50 ms', 'p95 ms', 'max ms'))
+            for stage in STAGES:
+                if stage in summary['stages']:
+                    s = summary['stages'][stage]
+                    print('%-10s %10.2f %10.1f %10.1f %10.1f' %
+                          (stage, s['total'], 1000 * s['p50'], 1000 * s['p95'], 1000 * s['max']))
+        for failure, count in sorted(summary['failures'].items()):
+            print('%s: %s file(s)' % (failure, count))
+        if summary['slowest_files']:
+            print('Slowest files:')
+            for slow_file in summary['slowest_files']:
+                print('  %0.2f s  %s' % (slow_file['total'], slow_file['file_path']))
+
+    def close(self):
+        if self.log is not None:
+            self.log.write(json.dumps({'summary': self.get_summary()}) + '\n')
+            self.log.close()
+            self.log = None
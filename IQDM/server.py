@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Embedded bokeh server for the trending dashboards, results datasets are loaded before the port is opened and every
+dashboard is served from the process running IQDM
+Created on Sat Oct 17 2026
+@author: Dan Cutright, PhD
+"""
+
+from functools import partial
+from os.path import basename
+from bokeh.application import Application
+from bokeh.application.handlers import FunctionHandler
+from bokeh.server.server import Server
+from IQDM.dataset_cache import get_dataset
+from IQDM.trending_delta4 import TrendingDashboard as TrendDelta4, get_filter_data
+from IQDM.trending_arccheck import add_dashboard as add_arccheck_dashboard
+
+
+REPORT_TYPES = ['delta4', 'sncpatient']  # each dashboard is served at /<report type>
+
+
+def get_report_type(file_path):
+    """
+    :param file_path: results csv file created by process_files
+    :type file_path: str
+    :return: report type of the results file (in REPORT_TYPES), or None if not an IQDM results file
+    :rtype: str
+    """
+    for report_type in REPORT_TYPES:
+        if basename(file_path).startswith('%s_results_' % report_type):
+            return report_type
+
+
+def warm_dataset(report_type, file_path, day_first=False):
+    """
+    Load a results dataset into the cache shared by every session, along with the values derived from it
+    :param report_type: an item of REPORT_TYPES
+    :type report_type: str
+    :param file_path: results csv file created by process_files
+    :type file_path: str
+    :param day_first: assume day first for ambiguous dates
+    :type day_first: bool
+    """
+    dataset = get_dataset(file_path, day_first=day_first)
+    if report_type == 'delta4':
+        dataset.get('delta4_filter_data', get_filter_data)
+
+
+def add_dashboard(doc, file_path, day_first=False, max_plot_points=None, live_interval=None):
+    """
+    Add the trending dashboard of a results file to the bokeh Document of a session
+    :param doc: bokeh Document of the session
+    :param file_path: results csv file created by process_files
+    :type file_path: str
+    :param day_first: assume day first for ambiguous dates
+    :type day_first: bool
+    :param max_plot_points: see main --max-plot-points
+    :type max_plot_points: int
+    :param live_interval: see main --live-interval, only the Delta4 dashboard has a live mode
+    :type live_interval: float
+    """
+    if get_report_type(file_path) == 'delta4':
+        dashboard = TrendDelta4(file_path, day_first=day_first, max_plot_points=max_plot_points)
+        doc.add_root(dashboard.layout)
+        doc.title = "Delta 4 Trending"
+        if live_interval:
+            doc.add_periodic_callback(dashboard.update_live, int(1000 * live_interval))
+    else:  # sncpatient
+        add_arccheck_dashboard(doc, file_path, day_first=day_first, max_plot_points=max_plot_points)
+
+
+def get_applications(file_paths, day_first=False, max_plot_points=None, live_interval=None):
+    """
+    :param file_paths: results csv files created by process_files, at most one per report type
+    :type file_paths: list
+    :param day_first: assume day first for ambiguous dates
+    :type day_first: bool
+    :param max_plot_points: see main --max-plot-points
+    :type max_plot_points: int
+    :param live_interval: see main --live-interval
+    :type live_interval: float
+    :return: bokeh Application of each route, e.g., {'/delta4': Application}
+    :rtype: dict
+    """
+    applications = {}
+    for file_path in file_paths:
+        report_type = get_report_type(file_path)
+        if report_type is None:
+            print('Did you provide an IQDM results csv? %s is not a known results file' % file_path)
+            continue
+        route = '/%s' % report_type
+        if route in applications:
+            print('Only one %s results file can be served, %s is ignored' % (report_type, file_path))
+            continue
+
+        print('Loading %s' % file_path)
+        warm_dataset(report_type, file_path, day_first=day_first)
+
+        handler = FunctionHandler(partial(add_dashboard, file_path=file_path, day_first=day_first,
+                                          max_plot_points=max_plot_points, live_interval=live_interval))
+        applications[route] = Application(handler)
+    return applications
+
+
+def serve(file_paths, port=5006, websocket_origin=None, day_first=False, max_plot_points=None, live_interval=None):
+    """
+    Start a bokeh server in this process with a trending dashboard of each results file, blocks until interrupted
+    :param file_paths: results csv files created by process_files, at most one per report type
+    :type file_paths: list
+    :param port: port of the webserver
+    :type port: int
+    :param websocket_origin: allow a websocket origin other than localhost, see bokeh documentation
+    :type websocket_origin: str
+    :param day_first: assume day first for ambiguous dates
+    :type day_first: bool
+    :param max_plot_points: see main --max-plot-points
+    :type max_plot_points: int
+    :param live_interval: see main --live-interval
+    :type live_interval: float
+    """
+    applications = get_applications(file_paths, day_first=day_first, max_plot_points=max_plot_points,
+                                    live_interval=live_interval)
+    if not applications:
+        return
+
+    kwargs = {'port': int(port)}
+    if websocket_origin:
+        kwargs['allow_websocket_origin'] = [websocket_origin]
+    server = Server(applications, **kwargs)
+    server.start()
+    for route in applications:
+        print('Trending dashboard available at http://localhost:%s%s' % (server.port, route))
+    server.io_loop.start()
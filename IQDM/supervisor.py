@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Process pool with a time and memory budget per task, used to isolate pdfs that stall or crash pdfminer
+Created on Sat Oct 17 2026
+@author: Dan Cutright, PhD
+"""
+
+from multiprocessing import Pipe, get_context
+from multiprocessing.connection import wait
+from time import time
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+
+WORKER_SHUTDOWN_TIMEOUT = 5.  # seconds to wait for a worker to exit before it is terminated
+
+# Workers are not forked from the scanning process, which runs other threads (e.g., discovery) whose locks could be
+# copied while held and deadlock the worker. forkserver is not available on Windows, which only supports spawn.
+try:
+    CONTEXT = get_context('forkserver')
+except ValueError:
+    CONTEXT = get_context('spawn')
+
+
+def set_memory_limit(memory_limit):
+    """
+    Limit the address space of the current process, so a runaway allocation raises MemoryError
+    :param memory_limit: maximum size in bytes, no limit if None
+    :type memory_limit: int
+    :return: True if the limit was applied
+    :rtype: bool
+    """
+    if memory_limit is None or resource is None:
+        return False
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        return True
+    except (ValueError, OSError):  # e.g., limit is above the hard limit of the user
+        return False
+
+
+def worker_main(function, connection, memory_limit, cleanup=None):
+    """
+    Loop of a worker process, each task is an (index, item) tuple and is answered with (index, function(item))
+    """
+    set_memory_limit(memory_limit)
+    if cleanup is not None:
+        cleanup()
+    try:
+        while True:
+            try:
+                task = connection.recv()
+            except (EOFError, OSError, KeyboardInterrupt):
+                break
+            if task is None:
+                break
+            index, item = task
+            connection.send((index, function(item)))
+    finally:
+        if cleanup is not None:
+            cleanup()
+
+
+class Worker:
+    def __init__(self, function, memory_limit=None, cleanup=None):
+        self.connection, child_connection = Pipe()
+        self.process = CONTEXT.Process(target=worker_main, args=(function, child_connection, memory_limit, cleanup))
+        self.process.daemon = True
+        self.process.start()
+        child_connection.close()
+        self.task = None  # (index, item) in progress
+        self.start_time = None
+
+    def submit(self, index, item):
+        self.task = (index, item)
+        self.start_time = time()
+        self.connection.send(self.task)
+
+    def stop(self, timeout=WORKER_SHUTDOWN_TIMEOUT):
+        try:
+            self.connection.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+
+
+class SupervisedPool:
+    """
+    Similar to multiprocessing.Pool.imap, but each worker is given one task at a time so a task exceeding the timeout
+    can be attributed and its worker terminated and replaced. Unlike Pool, a worker that dies (e.g., killed by the
+    operating system) does not stall the pool. Results are yielded in the order of the input.
+    """
+    def __init__(self, processes=1, timeout=None, memory_limit=None, cleanup=None):
+        """
+        :param processes: number of worker processes
+        :type processes: int
+        :param timeout: maximum seconds per task, no limit if None
+        :type timeout: float
+        :param memory_limit: maximum address space in bytes of each worker, no limit if None (or on Windows)
+        :type memory_limit: int
+        :param cleanup: called in each worker process when it starts and before it exits, e.g., to close files kept
+                        open by function, which must not be shared with the parent process
+        """
+        self.processes = max(1, processes)
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.cleanup = cleanup
+
+    def imap(self, function, iterable, on_failure):
+        """
+        :param function: picklable function of a single item (workers do not inherit the state of this process, e.g.,
+                         monkeypatched modules), should not raise exceptions
+        :param iterable: items to be passed to function
+        :param on_failure: function of (item, failure, error) returning the result of a task that timed out
+                           (failure='timeout') or whose worker exited (failure='worker died')
+        :return: generator of results, in the order of iterable
+        """
+        workers = [Worker(function, self.memory_limit, self.cleanup) for _ in range(self.processes)]
+        items = enumerate(iterable)
+        exhausted = False
+        results = {}
+        next_index = 0
+
+        try:
+            while True:
+                # keep every idle worker busy
+                for worker in workers:
+                    if worker.task is None and not exhausted:
+                        try:
+                            worker.submit(*next(items))
+                        except StopIteration:
+                            exhausted = True
+
+                busy = [worker for worker in workers if worker.task is not None]
+                if not busy:
+                    break
+
+                wait_time = None
+                if self.timeout is not None:
+                    wait_time = max(0., min([worker.start_time + self.timeout for worker in busy]) - time())
+                ready = wait([w.connection for w in busy] + [w.process.sentinel for w in busy], timeout=wait_time)
+
+                for i, worker in enumerate(workers):
+                    if worker.task is None:
+                        continue
+                    index, item = worker.task
+                    received = False
+                    if worker.connection in ready:
+                        try:
+                            results[index] = worker.connection.recv()[1]
+                            received = True
+                        except (EOFError, OSError):
+                            pass
+                    if received:
+                        worker.task = None
+                    elif worker.connection in ready or worker.process.sentinel in ready:
+                        worker.kill()
+                        results[index] = on_failure(item, 'worker died',
+                                                    'Worker exited with code %s' % worker.process.exitcode)
+                        workers[i] = Worker(function, self.memory_limit, self.cleanup)
+                    elif self.timeout is not None and time() - worker.start_time >= self.timeout:
+                        worker.kill()
+                        results[index] = on_failure(item, 'timeout', 'Exceeded %s second time limit' % self.timeout)
+                        workers[i] = Worker(function, self.memory_limit, self.cleanup)
+
+                while next_index in results:
+                    yield results.pop(next_index)
+                    next_index += 1
+        finally:
+            for worker in workers:
+                worker.stop()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of text extracted from pdf files
+Created on Sat Oct 17 2026
+@author: Dan Cutright, PhD
+"""
+
+from os.path import join, isdir, getsize, getmtime
+from os import walk, makedirs, remove, replace, utime, getpid
+from time import time
+import hashlib
+import codecs
+
+try:
+    from pdfminer import __version__ as PDFMINER_VERSION
+except ImportError:
+    PDFMINER_VERSION = 'unknown'
+
+
+CACHE_FORMAT_VERSION = '2'  # increment if the cached value or key definition changes
+DEFAULT_MAX_SIZE = 1024 ** 3  # bytes
+LOW_WATER_MARK = 0.9  # once max_size is exceeded, entries are evicted until the cache is this fraction of max_size
+
+
+class TextCache:
+    """
+    Text extracted from a pdf is stored in cache_dir, keyed by a hash of the pdf file content, the pdfminer version, the
+    layout analysis parameters (including any profiles that may be selected after the first page), and the number of
+    pages converted. The least recently used entries are removed once the total size of the cache
+    exceeds max_size, down to LOW_WATER_MARK of max_size so the next eviction is not needed until that space is used.
+    The size and last use of each entry are indexed in memory, cache_dir is only walked when the cache is opened (or
+    evict(rescan=True) is called, e.g., after other processes added entries).
+    """
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        """
+        :param cache_dir: directory to store cached text files, will be created if it does not exist
+        :type cache_dir: str
+        :param max_size: maximum total size of the cache in bytes
+        :type max_size: int
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if not isdir(cache_dir):
+            makedirs(cache_dir)
+        self.entries = {}  # file_path: [size, last use]
+        self.size = 0
+        self.load_index()
+
+    @staticmethod
+    def get_key(pdf_data, laparams, max_pages=None, laparams_profiles=None):
+        """
+        :param pdf_data: content of the pdf file
+        :type pdf_data: bytes
+        :param laparams: layout analysis parameters used for text extraction
+        :type laparams: LAParams
+        :param max_pages: number of pages converted, None if all pages
+        :type max_pages: int
+        :param laparams_profiles: keyword arguments of LAParams that may replace laparams, see convert_pdf_to_txt
+        :type laparams_profiles: list
+        :return: the cache key for this pdf file and text extraction settings
+        :rtype: str
+        """
+        key = hashlib.sha256(pdf_data)
+        settings = [CACHE_FORMAT_VERSION, PDFMINER_VERSION, repr(sorted(vars(laparams).items())), str(max_pages)]
+        if laparams_profiles:
+            settings.extend(sorted([repr(sorted(profile.items())) for profile in laparams_profiles]))
+        key.update('|'.join(settings).encode('utf-8'))
+        return key.hexdigest()
+
+    def get_file_path(self, key):
+        return join(self.cache_dir, key[:2], key + '.txt')
+
+    def get(self, key):
+        """
+        :param key: output from get_key
+        :return: the cached text, or None if not found
+        :rtype: str
+        """
+        file_path = self.get_file_path(key)
+        try:
+            with codecs.open(file_path, 'r', encoding='utf-8') as doc:
+                text = doc.read()
+            utime(file_path, None)  # modification time is used to find least recently used entries, see load_index
+            if file_path in self.entries:
+                self.entries[file_path][1] = time()
+            else:  # added by another process
+                self.add_entry(file_path)
+            return text
+        except (IOError, OSError):
+            return None
+
+    def set(self, key, text):
+        """
+        :param key: output from get_key
+        :param text: text extracted from the pdf file
+        :type text: str
+        """
+        file_path = self.get_file_path(key)
+        if not isdir(join(self.cache_dir, key[:2])):
+            makedirs(join(self.cache_dir, key[:2]), exist_ok=True)
+
+        # write to a temporary file first so other processes never read a partially written entry
+        temp_path = '%s.%s.tmp' % (file_path, getpid())
+        with codecs.open(temp_path, 'w', encoding='utf-8') as doc:
+            doc.write(text)
+        replace(temp_path, file_path)
+
+        self.add_entry(file_path)
+        if self.size > self.max_size:
+            self.evict()
+
+    def add_entry(self, file_path):
+        """
+        Add or update an entry of the in-memory index
+        :param file_path: file path of the cache entry
+        :type file_path: str
+        """
+        try:
+            size = getsize(file_path)
+        except OSError:  # removed by another process
+            return
+        if file_path in self.entries:
+            self.size -= self.entries[file_path][0]
+        self.entries[file_path] = [size, time()]
+        self.size += size
+
+    def get_entries(self):
+        """
+        :return: file path, size, and modification time of every cache entry
+        :rtype: list
+        """
+        entries = []
+        for dirName, subdirList, fileList in walk(self.cache_dir):
+            for file_name in fileList:
+                if file_name.endswith('.txt'):
+                    file_path = join(dirName, file_name)
+                    try:
+                        entries.append((file_path, getsize(file_path), getmtime(file_path)))
+                    except OSError:  # removed by another process
+                        continue
+        return entries
+
+    def load_index(self):
+        """
+        Index the size and modification time (i.e., last use) of every entry in cache_dir
+        """
+        self.entries = {file_path: [size, mtime] for file_path, size, mtime in self.get_entries()}
+        self.size = sum([entry[0] for entry in self.entries.values()])
+
+    def evict(self, rescan=False):
+        """
+        If the cache exceeds max_size, remove the least recently used entries until it is under LOW_WATER_MARK of
+        max_size
+        :param rescan: index cache_dir first, to include entries added by other processes
+        :type rescan: bool
+        """
+        if rescan:
+            self.load_index()
+        if self.size <= self.max_size:
+            return
+        target_size = LOW_WATER_MARK * self.max_size
+        for file_path in sorted(self.entries, key=lambda path: self.entries[path][1]):
+            if self.size <= target_size:
+                break
+            try:
+                remove(file_path)
+            except OSError:  # removed by another process
+                pass
+            self.size -= self.entries.pop(file_path)[0]
@@ -1,14 +1,9 @@
 from bokeh.io import curdoc
-from IQDM.trending_delta4 import TrendingDashboard as TrendDelta4
+from IQDM.server import add_dashboard
 import sys
 
 
+# bokeh serve trending.py --args <results csv> <true|false>, main serves the dashboards with IQDM.server instead
 FILE_PATH = sys.argv[1]
 DAY_FIRST = {'true': True, 'false': False}[sys.argv[2]]
-if 'delta4' in FILE_PATH:
-    dashboard = TrendDelta4(FILE_PATH, day_first=DAY_FIRST)
-    curdoc().add_root(dashboard.layout)
-    curdoc().title = "Delta 4 Trending"
-
-else:  # sncpatient
-    pass
+add_dashboard(curdoc(), FILE_PATH, day_first=DAY_FIRST)
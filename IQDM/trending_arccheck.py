@@ -3,7 +3,7 @@
 
 # trending_arccheck.py
 """
-Bokeh server script to analyze a delta4_results csv from IQDM
+Bokeh dashboard to analyze a sncpatient_results csv from IQDM, served by IQDM.server
 """
 # Copyright (c) 2019
 # Dan Cutright, PhD
@@ -11,23 +11,67 @@ Bokeh server script to analyze a delta4_results csv from IQDM
 # University of Chicago Medical Center
 # This file is part of IMRT QA Data Miner, partial based on code from DVH Analytics
 
-from bokeh.io import curdoc
 from bokeh.plotting import figure
 from bokeh.models import HoverTool, ColumnDataSource, Select, Div, TextInput, Legend, Spacer
 from bokeh.layouts import column, row
 from bokeh.models.widgets import DatePicker, CheckboxButtonGroup
 import numpy as np
-from IQDM.utilities import collapse_into_single_dates, moving_avg, get_control_limits, import_csv
-import sys
+from IQDM.dataset_cache import get_dataset
+from IQDM.dependency_graph import DependencyGraph
+from IQDM.utilities import collapse_into_single_dates, moving_avg, get_control_limits,\
+    get_level_of_detail_indices, get_avg_len
 
-FILE_PATH = sys.argv[1]
-DAY_FIRST = day_first = {'true': True, 'false': False}[sys.argv[2]]
+GAMMA_OPTIONS = ['5.0%/3.0mm', '3.0%/3.0mm', '3.0%/2.0mm', 'Any']
+IGNORED_Y = ['Patient Last Name', 'Patient First Name', 'Patient ID', 'Plan Date', 'Dose Type', 'Radiation Dev',
+             'Energy', 'file_name', 'Meas Uncertainty', 'Analysis Type', 'Notes']
 
 
-class Plot:
+def get_level_of_detail(data, x, x_range, max_plot_points):
+    """
+    :param data: list of each column of every filtered point, including y
+    :type data: dict
+    :param x: numeric x of each point, in the units of x_range
+    :param x_range: bokeh Range of the plot, used to refine the points in view
+    :param max_plot_points: maximum number of points in view, all points are returned if None
+    :type max_plot_points: int
+    :return: data with only the points sent to the browser
+    :rtype: dict
+    """
+    if max_plot_points is None:
+        return data
+    indices = get_level_of_detail_indices(np.asarray(x, dtype=float), np.asarray(data['y']), max_plot_points,
+                                          x_start=x_range.start, x_end=x_range.end)
+    return {key: np.asarray(values)[indices] for key, values in data.items()}
+
+
+class Controls:
+    """
+    Widgets of a session, read by the plots when they update
+    """
     def __init__(self, data):
 
+        y_options = [option for option in list(data) if option not in IGNORED_Y]
+        self.select_y = Select(title='Y-variable:', value='% Passed', options=y_options)
+
+        self.avg_len_input = TextInput(title='Avg. Len:', value='10', width=100)
+        self.percentile_input = TextInput(title='Percentile:', value='90', width=100)
+
+        self.start_date_picker = DatePicker(title='Start Date:', value=data['date_time_obj'][0])
+        self.end_date_picker = DatePicker(title='End Date:', value=data['date_time_obj'][-1])
+
+        self.checkbox_button_group = CheckboxButtonGroup(labels=GAMMA_OPTIONS, active=[3])
+
+        self.text = {key: Div() for key in [1, 2]}
+
+
+class Plot:
+    def __init__(self, data, controls, max_plot_points=None):
+
         self.data = data
+        self.controls = controls
+        self.max_plot_points = max_plot_points
+        # every filtered point, the plot sources may only have a downsampled copy, see max_plot_points
+        self.filtered_data = {key: {'x': [], 'y': []} for key in [1, 2]}
         self.source = {key: {'plot': ColumnDataSource(data=dict(x=[], y=[])),
                              'trend': ColumnDataSource(data=dict(x=[], y=[])),
                              'bound': ColumnDataSource(data=dict(x=[], y=[])),
@@ -35,6 +79,7 @@ class Plot:
                              'hist': ColumnDataSource(data=dict(x=[], y=[]))} for key in [1, 2]}
 
         self.ichart = None
+        self.graph = None
 
         self.__set_x()
         self.__create_figure()
@@ -44,6 +89,10 @@ class Plot:
         self.__add_legend()
         self.__set_plot_attr()
 
+        if self.max_plot_points is not None:
+            for attr in ['start', 'end']:
+                self.fig.x_range.on_change(attr, self.update_plot_detail)
+
     def __create_figure(self):
 
         self.fig = figure(plot_width=1000, plot_height=375, x_axis_type='datetime')
@@ -112,63 +161,82 @@ class Plot:
         self.histogram.yaxis.major_label_text_font_size = "15pt"
 
     def update_source(self, attr, old, new):
+        self.graph.update('data')
+
+    def update_filtered_data(self, source_key):
+        new_data = {key: [] for key in ['x', 'y', 'id', 'gamma_crit', 'file_name', 'gamma_index']}
+        controls = self.controls
+        active_gamma = [GAMMA_OPTIONS[a] for a in controls.checkbox_button_group.active]
+        # if select_linac[source_key] != 'None':
+        for i in range(len(self.x)):
+            # if select_linac[source_key].value == 'All' or \
+            #         self.data['Radiation Dev'][i] == select_linac[source_key].value:
+            if controls.end_date_picker.value > self.x[i] > controls.start_date_picker.value:
+                gamma_crit = "%s%%/%smm" % (self.data['Difference (%)'][i], self.data['Distance (mm)'][i])
+                if 'Any' in active_gamma or gamma_crit in active_gamma:
+                    try:
+                        y = float(self.data[controls.select_y.value][i])
+                    except ValueError:
+                        continue
+                    if np.isnan(y):
+                        continue
+                    new_data['y'].append(y)
+
+                    new_data['x'].append(self.x[i])
+                    new_data['id'].append(self.data['Patient ID'][i])
+                    new_data['gamma_crit'].append(gamma_crit)
+                    new_data['file_name'].append(self.data['file_name'][i])
+                    new_data['gamma_index'].append('%s%%' % self.data['% Passed'][i])
+                    # new_data['daily_corr'].append(self.data['Daily Corr'][i])
+                    # new_data['dta'].append('%s%%' % self.data['DTA'][i])
+
+        try:
+            y = new_data['y']
+            stats = (source_key, np.min(y), np.percentile(y, 25), np.sum(y)/len(y), np.percentile(y, 50),
+                     np.percentile(y, 75), np.max(y))
+            controls.text[source_key].text = "<b>Linac %s</b>: <b>Min</b>: %0.3f | <b>Low</b>: %0.3f | " \
+                                             "<b>Mean</b>: %0.3f | <b>Median</b>: %0.3f | <b>Upper</b>: %0.3f | " \
+                                             "<b>Max</b>: %0.3f" % stats
+        except:
+            controls.text[source_key].text = "<b>Linac %s</b>" % source_key
+
+        self.filtered_data[source_key] = new_data
+        return new_data
+
+    def update_plot(self, source_key):
+        self.source[source_key]['plot'].data = self.get_plot_data(source_key)
+
+        self.fig.yaxis.axis_label = self.controls.select_y.value
+        self.fig.xaxis.axis_label = 'Plan Date'
+
+    def get_plot_data(self, source_key):
+        data = self.filtered_data[source_key]
+        x = np.array(data['x'], dtype='datetime64[ms]').astype(float)  # bokeh datetime ranges are ms since epoch
+        return get_level_of_detail(data, x, self.fig.x_range, self.max_plot_points)
+
+    def update_plot_detail(self, attr, old, new):
         for source_key in [1, 2]:
-            new_data = {key: [] for key in ['x', 'y', 'id', 'gamma_crit', 'file_name', 'gamma_index']}
-            active_gamma = [gamma_options[a] for a in checkbox_button_group.active]
-            # if select_linac[source_key] != 'None':
-            for i in range(len(self.x)):
-                # if select_linac[source_key].value == 'All' or self.data['Radiation Dev'][i] == select_linac[source_key].value:
-                if end_date_picker.value > self.x[i] > start_date_picker.value:
-                    gamma_crit = "%s%%/%smm" % (self.data['Difference (%)'][i], self.data['Distance (mm)'][i])
-                    if 'Any' in active_gamma or gamma_crit in active_gamma:
-                        try:
-                            new_data['y'].append(float(self.data[select_y.value][i]))
-                        except ValueError:
-                            continue
-
-                        new_data['x'].append(self.x[i])
-                        new_data['id'].append(self.data['Patient ID'][i])
-                        new_data['gamma_crit'].append(gamma_crit)
-                        new_data['file_name'].append(self.data['file_name'][i])
-                        new_data['gamma_index'].append('%s%%' % self.data['% Passed'][i])
-                        # new_data['daily_corr'].append(self.data['Daily Corr'][i])
-                        # new_data['dta'].append('%s%%' % self.data['DTA'][i])
-
-            try:
-                y = new_data['y']
-                text[source_key].text = "<b>Linac %s</b>: <b>Min</b>: %0.3f | <b>Low</b>: %0.3f | <b>Mean</b>: %0.3f | <b>Median</b>: %0.3f | <b>Upper</b>: %0.3f | <b>Max</b>: %0.3f" % \
-                             (source_key, np.min(y), np.percentile(y, 25), np.sum(y)/len(y), np.percentile(y, 50), np.percentile(y, 75), np.max(y))
-            except:
-                text[source_key].text = "<b>Linac %s</b>" % source_key
-
-            self.source[source_key]['plot'].data = new_data
-
-            self.fig.yaxis.axis_label = select_y.value
-            self.fig.xaxis.axis_label = 'Plan Date'
-
-            self.update_histogram(source_key, bin_size=20)
-            self.update_trend(source_key, int(float(avg_len_input.value)), float(percentile_input.value))
-            self.ichart.update_plot()
+            self.source[source_key]['plot'].data = self.get_plot_data(source_key)
 
     def update_histogram(self, source_key, bin_size=10):
         width_fraction = 0.9
-        hist, bins = np.histogram(self.source[source_key]['plot'].data['y'], bins=bin_size)
+        hist, bins = np.histogram(self.filtered_data[source_key]['y'], bins=bin_size)
         width = [width_fraction * (bins[1] - bins[0])] * bin_size
         center = (bins[:-1] + bins[1:]) / 2.
         self.source[source_key]['hist'].data = {'x': center, 'top': hist, 'width': width}
 
-        self.histogram.xaxis.axis_label = select_y.value
+        self.histogram.xaxis.axis_label = self.controls.select_y.value
 
     def update_trend(self, source_key, avg_len, percentile):
-        x = self.source[source_key]['plot'].data['x']
-        y = self.source[source_key]['plot'].data['y']
+        x = self.filtered_data[source_key]['x']
+        y = self.filtered_data[source_key]['y']
         if x and y:
             x_len = len(x)
 
             data_collapsed = collapse_into_single_dates(x, y)
             x_trend, y_trend = moving_avg(data_collapsed, avg_len)
 
-            y_np = np.array(self.source[source_key]['plot'].data['y'])
+            y_np = np.array(y)
             upper_bound = float(np.percentile(y_np, 50. + percentile / 2.))
             average = float(np.percentile(y_np, 50))
             lower_bound = float(np.percentile(y_np, 50. - percentile / 2.))
@@ -207,6 +275,7 @@ class PlotControlChart:
         self.main_plot = main_plot
 
         self.y_axis_label = ''
+        self.filtered_data = None  # every filtered point, the source may only have a downsampled copy
         self.source = {'plot': ColumnDataSource(data=dict(x=[], y=[], mrn=[], color=[], alpha=[], dates=[],
                                                           gamma_index=[], daily_corr=[], gamma_crit=[], dta=[])),
                        'center_line': ColumnDataSource(data=dict(x=[], y=[], mrn=[])),
@@ -227,6 +296,10 @@ class PlotControlChart:
         self.__create_divs()
         self.__add_legend()
 
+        if self.main_plot.max_plot_points is not None:
+            for attr in ['start', 'end']:
+                self.figure.x_range.on_change(attr, self.update_plot_detail)
+
     def __add_plot_data(self):
         self.plot_data = self.figure.circle('x', 'y', source=self.source['plot'],
                                             size=8, color='color', alpha='alpha')
@@ -272,22 +345,22 @@ class PlotControlChart:
 
     def update_plot(self):
 
-        self.y_axis_label = select_y.value
+        self.y_axis_label = self.main_plot.controls.select_y.value
         self.figure.yaxis.axis_label = self.y_axis_label
 
-        y = self.main_plot.source[1]['plot'].data['y']
-        mrn = self.main_plot.source[1]['plot'].data['id']
-        dates = self.main_plot.source[1]['plot'].data['x']
-        gamma_crit = self.main_plot.source[1]['plot'].data['gamma_crit']
-        gamma_index = self.main_plot.source[1]['plot'].data['gamma_index']
-        # daily_corr = self.main_plot.source[1]['plot'].data['daily_corr']
-        # dta = self.main_plot.source[1]['plot'].data['dta']
-        file_name = self.main_plot.source[1]['plot'].data['file_name']
+        y = self.main_plot.filtered_data[1]['y']
+        mrn = self.main_plot.filtered_data[1]['id']
+        dates = self.main_plot.filtered_data[1]['x']
+        gamma_crit = self.main_plot.filtered_data[1]['gamma_crit']
+        gamma_index = self.main_plot.filtered_data[1]['gamma_index']
+        # daily_corr = self.main_plot.filtered_data[1]['daily_corr']
+        # dta = self.main_plot.filtered_data[1]['dta']
+        file_name = self.main_plot.filtered_data[1]['file_name']
         x = list(range(len(dates)))
 
         center_line, ucl, lcl = get_control_limits(y)
 
-        if select_y.value in ['% Passed', 'Gamma-Index', 'DTA'] and ucl > 100:
+        if self.y_axis_label in ['% Passed', 'Gamma-Index', 'DTA'] and ucl > 100:
             ucl = 100
 
         colors = ['red', 'blue']
@@ -295,9 +368,10 @@ class PlotControlChart:
         color = [colors[ucl >= value >= lcl] for value in y]
         alpha = [alphas[ucl >= value >= lcl] for value in y]
 
-        self.source['plot'].data = {'x': x, 'y': y, 'mrn': mrn, 'gamma_crit': gamma_crit, 'gamma_index': gamma_index,
-                                    'color': color, 'alpha': alpha,
-                                    'dates': dates, 'file_name': file_name}
+        self.filtered_data = {'x': x, 'y': y, 'mrn': mrn, 'gamma_crit': gamma_crit, 'gamma_index': gamma_index,
+                              'color': color, 'alpha': alpha,
+                              'dates': dates, 'file_name': file_name}
+        self.source['plot'].data = self.get_plot_data()
 
         self.source['patch'].data = {'x': [x[0], x[-1], x[-1], x[0]],
                                      'y': [ucl, ucl, lcl, lcl]}
@@ -316,63 +390,91 @@ class PlotControlChart:
         self.div_ucl.text = "<b>UCL</b>: %0.3f" % ucl
         self.div_lcl.text = "<b>LCL</b>: %0.3f" % lcl
 
+    def get_plot_data(self):
+        return get_level_of_detail(self.filtered_data, self.filtered_data['x'], self.figure.x_range,
+                                   self.main_plot.max_plot_points)
+
+    def update_plot_detail(self, attr, old, new):
+        self.source['plot'].data = self.get_plot_data()
+
     def clear_div(self):
         self.div_center_line.text = "<b>Center line</b>:"
         self.div_ucl.text = "<b>UCL</b>:"
         self.div_lcl.text = "<b>LCL</b>:"
 
 
-data = import_csv(FILE_PATH, day_first=DAY_FIRST)
-plot = Plot(data)
-ichart = PlotControlChart(plot)
-plot.ichart = ichart
-ignored_y = ['Patient Last Name', 'Patient First Name', 'Patient ID', 'Plan Date', 'Dose Type', 'Radiation Dev',
-             'Energy', 'file_name', 'Meas Uncertainty', 'Analysis Type', 'Notes']
-y_options = [option for option in list(data) if option not in ignored_y]
-select_y = Select(title='Y-variable:', value='% Passed', options=y_options)
-select_y.on_change('value', plot.update_source)
-
-# linacs = list(set(data['Radiation Dev']))
-# linacs.sort()
-# linacs.insert(0, 'All')
-# linacs.append('None')
-# select_linac = {key: Select(title='Linac %s:' % key, value='All', options=['All'], width=250) for key in [1, 2]}
-# select_linac[2].value = 'None'
-# select_linac[1].on_change('value', plot.update_source)
-# select_linac[2].on_change('value', plot.update_source)
-
-avg_len_input = TextInput(title='Avg. Len:', value='10', width=100)
-avg_len_input.on_change('value', plot.update_source)
-
-percentile_input = TextInput(title='Percentile:', value='90', width=100)
-percentile_input.on_change('value', plot.update_source)
-
-
-start_date_picker = DatePicker(title='Start Date:', value=plot.x[0])
-end_date_picker = DatePicker(title='End Date:', value=plot.x[-1])
-start_date_picker.on_change('value', plot.update_source)
-end_date_picker.on_change('value', plot.update_source)
-
-gamma_options = ['5.0%/3.0mm', '3.0%/3.0mm', '3.0%/2.0mm', 'Any']
-checkbox_button_group = CheckboxButtonGroup(labels=gamma_options, active=[3])
-checkbox_button_group.on_change('active', plot.update_source)
-
-text = {key: Div() for key in [1, 2]}
-
-plot.update_source(None, None, None)
-
-layout = column(row(select_y, avg_len_input, percentile_input),
-                row(start_date_picker, end_date_picker),
-                row(Div(text='Gamma Criteria: '), checkbox_button_group),
-                text[1],
-                text[2],
-                row(Spacer(width=10), plot.fig),
-                Spacer(height=50),
-                row(Spacer(width=10), plot.histogram),
-                Spacer(height=50),
-                row(Spacer(width=10), ichart.figure),
-                row(ichart.div_center_line, ichart.div_ucl, ichart.div_lcl))
-
-
-curdoc().add_root(layout)
-curdoc().title = "ArcCheck Trending"
+def add_dashboard(doc, file_path, day_first=False, max_plot_points=None):
+    """
+    Add the ArcCheck trending dashboard of a results csv to a bokeh Document
+    :param doc: bokeh Document of the session
+    :param file_path: sncpatient results csv file created by process_files
+    :type file_path: str
+    :param day_first: assume day first for ambiguous dates
+    :type day_first: bool
+    :param max_plot_points: maximum number of points in view sent to the browser, all points are sent if None
+    :type max_plot_points: int
+    """
+    data = get_dataset(file_path, day_first=day_first).data  # loaded once per server process, read-only
+    controls = Controls(data)
+    plot = Plot(data, controls, max_plot_points=max_plot_points)
+    ichart = PlotControlChart(plot)
+    plot.ichart = ichart
+
+    # linacs = list(set(data['Radiation Dev']))
+    # linacs.sort()
+    # linacs.insert(0, 'All')
+    # linacs.append('None')
+    # select_linac = {key: Select(title='Linac %s:' % key, value='All', options=['All'], width=250) for key in [1, 2]}
+    # select_linac[2].value = 'None'
+    # select_linac[1].on_change('value', plot.update_source)
+    # select_linac[2].on_change('value', plot.update_source)
+
+    # each widget is an input node, so a change only updates the views that depend on it
+    graph = DependencyGraph()
+    graph.add('data', lambda: None)
+    graph.add('y', lambda: controls.select_y.value)
+    graph.add('dates', lambda: (controls.start_date_picker.value, controls.end_date_picker.value))
+    graph.add('gamma', lambda: controls.checkbox_button_group.active)
+    graph.add('avg_len', lambda: get_avg_len(controls.avg_len_input.value))
+    graph.add('percentile', lambda: float(controls.percentile_input.value))
+    for source_key in [1, 2]:
+        graph.add('filtered_%s' % source_key, lambda *args, key=source_key: plot.update_filtered_data(key),
+                  ['data', 'y', 'dates', 'gamma'])
+        graph.add('plot_%s' % source_key, lambda *args, key=source_key: plot.update_plot(key),
+                  ['filtered_%s' % source_key], view=True)
+        graph.add('histogram_%s' % source_key, lambda *args, key=source_key: plot.update_histogram(key, bin_size=20),
+                  ['filtered_%s' % source_key], view=True)
+        graph.add('trend_%s' % source_key, lambda data, avg_len, percentile, key=source_key:
+                  plot.update_trend(key, avg_len, percentile), ['filtered_%s' % source_key, 'avg_len', 'percentile'],
+                  view=True)
+    graph.add('control_chart', lambda *args: ichart.update_plot(), ['filtered_1'], view=True)
+    plot.graph = graph
+
+    def get_input_callback(name):
+        def callback(attr, old, new):
+            graph.update(name)
+        return callback
+
+    controls.select_y.on_change('value', get_input_callback('y'))
+    controls.avg_len_input.on_change('value', get_input_callback('avg_len'))
+    controls.percentile_input.on_change('value', get_input_callback('percentile'))
+    controls.start_date_picker.on_change('value', get_input_callback('dates'))
+    controls.end_date_picker.on_change('value', get_input_callback('dates'))
+    controls.checkbox_button_group.on_change('active', get_input_callback('gamma'))
+
+    plot.update_source(None, None, None)
+
+    layout = column(row(controls.select_y, controls.avg_len_input, controls.percentile_input),
+                    row(controls.start_date_picker, controls.end_date_picker),
+                    row(Div(text='Gamma Criteria: '), controls.checkbox_button_group),
+                    controls.text[1],
+                    controls.text[2],
+                    row(Spacer(width=10), plot.fig),
+                    Spacer(height=50),
+                    row(Spacer(width=10), plot.histogram),
+                    Spacer(height=50),
+                    row(Spacer(width=10), ichart.figure),
+                    row(ichart.div_center_line, ichart.div_ucl, ichart.div_lcl))
+
+    doc.add_root(layout)
+    doc.title = "ArcCheck Trending"
@@ -16,22 +16,137 @@ from bokeh.models import HoverTool, ColumnDataSource, Select, Div, TextInput, Le
 from bokeh.layouts import column, row
 from bokeh.models.widgets import DatePicker, CheckboxButtonGroup
 import numpy as np
-from IQDM.utilities import collapse_into_single_dates, moving_avg, get_control_limits, import_csv
+from dateutil.parser import parse as date_parser
+from IQDM.dataset_cache import get_dataset
+from IQDM.dependency_graph import DependencyGraph
+from IQDM.utilities import collapse_into_single_dates, moving_avg, to_float_array,\
+    get_level_of_detail_indices, get_control_limit_sums, get_control_limits_from_sums, get_results_file_state,\
+    read_appended_results, get_date_times, get_avg_len
 
 GROUPS = [1, 2]
 COLORS = {1: 'blue', 2: 'red'}
 
 # TODO: Generalize for different parsers
 MAIN_PLOT_KEYS = ['x', 'y', 'id', 'gamma_crit', 'file_name', 'gamma_index', 'daily_corr', 'dta']
+ICHART_COLORS = np.array(['red', 'blue'], dtype=object)  # indexed by in control
+ICHART_ALPHAS = np.array([0.3, 0.4])
+
+
+def get_date_picker_value(date_picker):
+    """
+    :param date_picker: a bokeh DatePicker, value may be a date or a string depending on the bokeh version
+    :return: the value of date_picker
+    :rtype: np.datetime64
+    """
+    return np.datetime64(date_parser(str(date_picker.value)).date(), 'D')
+
+
+def get_categorical_codes(values, categories=None, codes=None):
+    """
+    :param values: value of each row, or of the rows appended after the rows of codes
+    :param categories: unique values of the previous rows, if values are appended
+    :type categories: np.ndarray
+    :param codes: categorical codes of the previous rows, if values are appended
+    :type codes: np.ndarray
+    :return: sorted unique values of all rows, and the index in these of each row
+    :rtype: tuple
+    """
+    new_categories, new_codes = np.unique(np.asarray(values).astype(str), return_inverse=True)
+    if categories is None:
+        return new_categories, new_codes.reshape(-1)
+    all_categories = np.union1d(categories, new_categories)
+    return all_categories, np.concatenate([np.searchsorted(all_categories, categories)[codes],
+                                           np.searchsorted(all_categories, new_categories)[new_codes.reshape(-1)]])
+
+
+def get_gamma_crit(data):
+    """
+    :param data: output from import_csv
+    :type data: dict
+    :return: gamma criteria of each row, e.g., '3.0%/2.0mm'
+    :rtype: np.ndarray
+    """
+    return np.array(["%s%%/%smm" % (dose, dist) for dose, dist in zip(data['Gamma Dose Criteria'],
+                                                                     data['Gamma Dist Criteria'])], dtype=str)
+
+
+def get_ichart_columns(group_data, start, in_control):
+    """
+    :param group_data: columns of the main plot source, see TrendingDashboard.get_group_data
+    :type group_data: dict
+    :param start: study number of the first row
+    :type start: int
+    :param in_control: boolean of each row, True if within the control limits
+    :type in_control: np.ndarray
+    :return: columns of the control chart source
+    :rtype: dict
+    """
+    return {'x': start + np.arange(len(group_data['y'])), 'y': group_data['y'], 'mrn': group_data['id'],
+            'gamma_crit': group_data['gamma_crit'], 'gamma_index': group_data['gamma_index'],
+            'daily_corr': group_data['daily_corr'], 'dta': group_data['dta'],
+            'color': ICHART_COLORS[in_control.astype(int)], 'alpha': ICHART_ALPHAS[in_control.astype(int)],
+            'dates': group_data['x'], 'file_name': group_data['file_name']}
+
+
+def get_plot_data_columns(data, dates, gamma_crit):
+    """
+    :param data: output from import_csv
+    :type data: dict
+    :param dates: date of each row
+    :type dates: np.ndarray
+    :param gamma_crit: output from get_gamma_crit
+    :type gamma_crit: np.ndarray
+    :return: columns of the main plot source, other than y
+    :rtype: dict
+    """
+    return {'x': dates,
+            'id': data['Patient ID'],
+            'gamma_crit': gamma_crit,
+            'file_name': data['file_name'],
+            'gamma_index': np.array(['%s%%' % v for v in data['Gamma-Index']], dtype=object),
+            'daily_corr': data['Daily Corr'],
+            'dta': np.array(['%s%%' % v for v in data['DTA']], dtype=object)}
+
+
+def get_filter_data(data):
+    """
+    :param data: output from import_csv
+    :type data: dict
+    :return: values used by TrendingDashboard.update(), shared by every session viewing data
+    :rtype: dict
+    """
+    dates = data['date_time_obj'].astype('datetime64[D]')
+    gamma_crit = get_gamma_crit(data)
+    filter_data = {'dates': dates, 'plot_data_columns': get_plot_data_columns(data, dates, gamma_crit)}
+    filter_data['linac_categories'], filter_data['linac_codes'] = get_categorical_codes(data['Radiation Dev'])
+    filter_data['energy_categories'], filter_data['energy_codes'] = get_categorical_codes(data['Energy'])
+    filter_data['gamma_crit_categories'], filter_data['gamma_crit_codes'] = get_categorical_codes(gamma_crit)
+    return filter_data
 
 
 class TrendingDashboard:
-    def __init__(self, file_path, day_first=False):
-
-        self.data = import_csv(file_path, day_first=day_first)
+    def __init__(self, file_path, day_first=False, max_plot_points=None):
+        """
+        :param file_path: results csv file created by process_files
+        :type file_path: str
+        :param day_first: assume day first for ambiguous dates
+        :type day_first: bool
+        :param max_plot_points: level-of-detail mode, the scatter plot and control chart are sent at most this many
+                                points in view (downsampled with LTTB), and refined as the user zooms. Statistics,
+                                histograms and trends always use every point. All points are sent if None.
+        :type max_plot_points: int
+        """
+
+        self.file_path = file_path
+        self.day_first = day_first
+        self.dataset = get_dataset(file_path, day_first=day_first)  # shared by every session, read-only
+        self.data = self.dataset.data
+        self.file_state = self.get_dataset_file_state()
+        self.max_plot_points = max_plot_points
 
         self.__create_sources()
         self.__set_x()
+        self.__set_filter_data()
         self.__create_figures()
         self.__set_properties()
         self.__create_divs()
@@ -42,6 +157,7 @@ class TrendingDashboard:
         self.__add_legend()
 
         self.__create_widgets()
+        self.__create_graph()
         self.__bind_widgets()
         self.__do_layout()
 
@@ -63,9 +179,74 @@ class TrendingDashboard:
                                     'bound': ColumnDataSource(data=dict(x=[], mrn=[], upper=[], avg=[], lower=[])),
                                     'patch': ColumnDataSource(data=dict(x=[], y=[]))} for grp in GROUPS}
 
+        # every filtered point, the plot sources may only have a downsampled copy, see max_plot_points
+        self.group_data = {grp: {} for grp in GROUPS}
+        self.ichart_group_data = {grp: {} for grp in GROUPS}
+        self.control_limit_sums = {grp: None for grp in GROUPS}  # see utilities.get_control_limit_sums
+
     def __set_x(self):
         self.x = self.data['date_time_obj']
 
+    def __set_filter_data(self):
+        """
+        Values used by update() are computed once per dataset, filtering is then done with boolean masks
+        """
+        if self.data is self.dataset.data:
+            filter_data = self.dataset.get('delta4_filter_data', get_filter_data)
+        else:  # rows were added by the live mode
+            filter_data = get_filter_data(self.data)
+
+        self.dates = filter_data['dates']
+        # categorical codes, e.g., self.linac_codes == index of linac in self.linac_categories
+        self.linac_categories, self.linac_codes = filter_data['linac_categories'], filter_data['linac_codes']
+        self.energy_categories, self.energy_codes = filter_data['energy_categories'], filter_data['energy_codes']
+        self.gamma_crit_categories = filter_data['gamma_crit_categories']
+        self.gamma_crit_codes = filter_data['gamma_crit_codes']
+        self.plot_data_columns = filter_data['plot_data_columns']
+        self.y_data = {}  # float array of each y-variable, computed when first selected
+
+    def append_filter_data(self, new_data):
+        """
+        Extend the values computed by __set_filter_data with rows appended to the end of self.data
+        :param new_data: the appended rows, in the format of import_csv
+        :type new_data: dict
+        """
+        new_dates = new_data['date_time_obj'].astype('datetime64[D]')
+        self.dates = np.concatenate([self.dates, new_dates])
+
+        self.linac_categories, self.linac_codes = get_categorical_codes(new_data['Radiation Dev'],
+                                                                        self.linac_categories, self.linac_codes)
+        self.energy_categories, self.energy_codes = get_categorical_codes(new_data['Energy'],
+                                                                          self.energy_categories, self.energy_codes)
+        gamma_crit = get_gamma_crit(new_data)
+        self.gamma_crit_categories, self.gamma_crit_codes = get_categorical_codes(gamma_crit,
+                                                                                  self.gamma_crit_categories,
+                                                                                  self.gamma_crit_codes)
+
+        new_columns = get_plot_data_columns(new_data, new_dates, gamma_crit)
+        self.plot_data_columns = {key: np.concatenate([values, new_columns[key]])
+                                  for key, values in self.plot_data_columns.items()}
+        self.y_data = {}
+
+    def get_y_data(self, key):
+        if key not in self.y_data:
+            y = self.data[key] if self.data[key].dtype.kind == 'f' else to_float_array(self.data[key])
+            self.y_data[key] = np.full(len(self.x), np.nan) if y is None else y
+        return self.y_data[key]
+
+    def get_category_mask(self, codes, categories, value):
+        """
+        :param codes: categorical codes of each row
+        :param categories: unique values indexed by codes
+        :param value: the selected category
+        :return: boolean mask of rows with category equal to value
+        :rtype: np.ndarray
+        """
+        index = np.searchsorted(categories, value)
+        if index < len(categories) and categories[index] == value:
+            return codes == index
+        return np.zeros(len(codes), dtype=bool)
+
     def __create_figures(self):
 
         self.fig = figure(plot_width=1000, plot_height=375, x_axis_type='datetime')
@@ -220,18 +401,79 @@ class TrendingDashboard:
         self.gamma_options = ['5.0%/3.0mm', '3.0%/3.0mm', '3.0%/2.0mm', 'Any']
         self.checkbox_button_group = CheckboxButtonGroup(labels=self.gamma_options, active=[3])
 
+    def __create_graph(self):
+        """
+        Each widget is an input node of the graph, so a change only updates the views that depend on it, e.g., a
+        change of bins only updates the histograms
+        """
+        graph = DependencyGraph()
+
+        # input nodes, 'data' is invalidated when the dataset changes
+        graph.add('data', lambda: None)
+        graph.add('y', lambda: self.select_y.value)
+        graph.add('dates', lambda: (self.start_date_picker.value, self.end_date_picker.value))
+        graph.add('gamma', lambda: self.checkbox_button_group.active)
+        graph.add('avg_len', lambda: get_avg_len(self.avg_len_input.value))
+        graph.add('percentile', lambda: float(self.percentile_input.value))
+        graph.add('bins', lambda: self.bins_input.value)
+        graph.add('plot_range', lambda: None)
+        graph.add('ichart_range', lambda: None)
+        for grp in GROUPS:
+            graph.add('linac_%s' % grp, lambda grp=grp: self.select_linac[grp].value)
+            graph.add('energy_%s' % grp, lambda grp=grp: self.select_energies[grp].value)
+
+        graph.add('y_data', lambda data, y: self.get_y_data(y), ['data', 'y'])
+        graph.add('shared_mask', lambda y_data, *args: self.get_shared_mask(y_data), ['y_data', 'dates', 'gamma'])
+        graph.add('labels', lambda y: self.update_labels(), ['y'], view=True)
+
+        for grp in GROUPS:
+            graph.add('group_data_%s' % grp,
+                      lambda mask, y_data, *args, grp=grp: self.set_group_data(grp, mask, y_data),
+                      ['shared_mask', 'y_data', 'linac_%s' % grp, 'energy_%s' % grp])
+            data_node = ['group_data_%s' % grp]
+            graph.add('summary_%s' % grp, lambda *args, grp=grp: self.update_summary(grp), data_node, view=True)
+            graph.add('plot_%s' % grp, lambda *args, grp=grp: self.update_plot(grp), data_node + ['plot_range'],
+                      view=True)
+            graph.add('histogram_%s' % grp, lambda *args, grp=grp: self.update_histogram(grp), data_node + ['bins'],
+                      view=True)
+            graph.add('trend_%s' % grp, lambda data, avg_len, percentile, grp=grp:
+                      self.update_trend(grp, avg_len, percentile), data_node + ['avg_len', 'percentile'], view=True)
+            graph.add('control_chart_%s' % grp, lambda *args, grp=grp: self.update_control_chart(grp),
+                      data_node + ['y'], view=True)
+            graph.add('ichart_plot_%s' % grp, lambda *args, grp=grp: self.update_ichart_plot(grp),
+                      ['control_chart_%s' % grp, 'ichart_range'], view=True)
+
+        self.graph = graph
+
+    def get_input_callback(self, name):
+        """
+        :param name: name of an input node of self.graph
+        :type name: str
+        :return: a bokeh on_change callback, updating the views that depend on the input
+        """
+        def callback(attr, old, new):
+            self.graph.update(name)
+        return callback
+
     def __bind_widgets(self):
+        self.input_callbacks = {name: self.get_input_callback(name) for name in self.graph.nodes
+                                if not self.graph.nodes[name]['dependencies']}
 
-        self.select_y.on_change('value', self.update_source_ticker)
+        self.select_y.on_change('value', self.input_callbacks['y'])
         for grp in GROUPS:
-            self.select_linac[grp].on_change('value', self.update_source_ticker)
-            self.select_energies[grp].on_change('value', self.update_source_ticker)
-        self.avg_len_input.on_change('value', self.update_source_ticker)
-        self.percentile_input.on_change('value', self.update_source_ticker)
-        self.bins_input.on_change('value', self.update_source_ticker)
-        self.start_date_picker.on_change('value', self.update_source_ticker)
-        self.end_date_picker.on_change('value', self.update_source_ticker)
-        self.checkbox_button_group.on_change('active', self.update_source_ticker)
+            self.select_linac[grp].on_change('value', self.input_callbacks['linac_%s' % grp])
+            self.select_energies[grp].on_change('value', self.input_callbacks['energy_%s' % grp])
+        self.avg_len_input.on_change('value', self.input_callbacks['avg_len'])
+        self.percentile_input.on_change('value', self.input_callbacks['percentile'])
+        self.bins_input.on_change('value', self.input_callbacks['bins'])
+        self.start_date_picker.on_change('value', self.input_callbacks['dates'])
+        self.end_date_picker.on_change('value', self.input_callbacks['dates'])
+        self.checkbox_button_group.on_change('active', self.input_callbacks['gamma'])
+
+        if self.max_plot_points is not None:
+            for attr in ['start', 'end']:
+                self.fig.x_range.on_change(attr, self.input_callbacks['plot_range'])
+                self.ichart.x_range.on_change(attr, self.input_callbacks['ichart_range'])
 
     def __do_layout(self):
         # TODO: Generalize for 1 or 2 groups
@@ -250,54 +492,86 @@ class TrendingDashboard:
                              row(self.div_center_line[1], self.div_ucl[1], self.div_lcl[1]),
                              row(self.div_center_line[2], self.div_ucl[2], self.div_lcl[2]))
 
-    def update_source_ticker(self, attr, old, new):
-        self.update()
+    def get_shared_mask(self, y_data, start=0):
+        """
+        :param y_data: output from get_y_data
+        :type y_data: np.ndarray
+        :param start: only rows from this index are filtered, used for appended rows
+        :type start: int
+        :return: boolean mask of rows[start:] passing the filters shared by all groups
+        :rtype: np.ndarray
+        """
+        active_gamma = [self.gamma_options[a] for a in self.checkbox_button_group.active]
+
+        mask = ~np.isnan(y_data[start:])
+        start_date = get_date_picker_value(self.start_date_picker)
+        end_date = get_date_picker_value(self.end_date_picker)
+        dates = self.dates[start:]
+        mask &= (dates > start_date) & (dates < end_date)
+        if 'Any' not in active_gamma:
+            mask &= np.isin(self.gamma_crit_codes[start:],
+                            np.flatnonzero(np.isin(self.gamma_crit_categories, active_gamma)))
+        return mask
+
+    def get_group_data(self, grp, shared_mask, y_data, start=0):
+        """
+        :param grp: group of the linac and energy filters
+        :type grp: int
+        :param shared_mask: output from get_shared_mask
+        :type shared_mask: np.ndarray
+        :param y_data: output from get_y_data
+        :type y_data: np.ndarray
+        :param start: the start used for shared_mask
+        :type start: int
+        :return: columns of the main plot source of the filtered rows
+        :rtype: dict
+        """
+        linac = self.select_linac[grp].value
+        if linac == 'None':
+            group_mask = np.zeros(len(shared_mask), dtype=bool)
+        elif linac == 'All':
+            group_mask = shared_mask.copy()
+        else:
+            group_mask = shared_mask & self.get_category_mask(self.linac_codes[start:], self.linac_categories, linac)
+
+        energy = self.select_energies[grp].value
+        if energy != 'Any':
+            group_mask &= self.get_category_mask(self.energy_codes[start:], self.energy_categories, energy)
+
+        indices = start + np.flatnonzero(group_mask)
+        new_data = {key: values[indices] for key, values in self.plot_data_columns.items()}
+        new_data['y'] = y_data[indices]
+        return new_data
 
     def update(self):
-        for grp in GROUPS:
-            new_data = {key: [] for key in MAIN_PLOT_KEYS}
-            active_gamma = [self.gamma_options[a] for a in self.checkbox_button_group.active]
-            if self.select_linac[grp] != 'None':
-                for i in range(len(self.x)):
-                    if self.select_linac[grp].value == 'All' or \
-                            self.data['Radiation Dev'][i] == self.select_linac[grp].value:
-                        if self.end_date_picker.value > self.x[i] > self.start_date_picker.value:
-                            gamma_crit = "%s%%/%smm" % (self.data['Gamma Dose Criteria'][i],
-                                                        self.data['Gamma Dist Criteria'][i])
-                            if 'Any' in active_gamma or gamma_crit in active_gamma:
-                                if 'Any' == self.select_energies[grp].value or \
-                                        self.data['Energy'][i] == self.select_energies[grp].value:
-
-                                    try:
-                                        new_data['y'].append(float(self.data[self.select_y.value][i]))
-                                    except ValueError:
-                                        continue
-                                    new_data['x'].append(self.x[i])
-                                    new_data['id'].append(self.data['Patient ID'][i])
-                                    new_data['gamma_crit'].append(gamma_crit)
-                                    new_data['file_name'].append(self.data['file_name'][i])
-                                    new_data['gamma_index'].append('%s%%' % self.data['Gamma-Index'][i])
-                                    new_data['daily_corr'].append(self.data['Daily Corr'][i])
-                                    new_data['dta'].append('%s%%' % self.data['DTA'][i])
-
-            try:
-                y = new_data['y']
-                self.div_summary[grp].text = "<b>Linac %s</b>: <b>Min</b>: %0.3f | <b>Low</b>: %0.3f | " \
-                                             "<b>Mean</b>: %0.3f | <b>Median</b>: %0.3f | <b>Upper</b>: %0.3f | " \
-                                             "<b>Max</b>: %0.3f" % \
-                                             (grp, np.min(y), np.percentile(y, 25), np.sum(y)/len(y),
-                                              np.percentile(y, 50), np.percentile(y, 75), np.max(y))
-            except:
-                self.div_summary[grp].text = "<b>Linac %s</b>" % grp
-
-            self.source[grp]['plot'].data = new_data
-
-            self.fig.yaxis.axis_label = self.select_y.value
-            self.fig.xaxis.axis_label = 'Plan Date'
-
-            self.update_histogram(grp)
-            self.update_trend(grp, int(float(self.avg_len_input.value)), float(self.percentile_input.value))
-            self.update_ichart()
+        """
+        Update every view, e.g., after the dataset changed
+        """
+        self.graph.update('data')
+
+    def set_group_data(self, grp, shared_mask, y_data):
+        self.group_data[grp] = self.get_group_data(grp, shared_mask, y_data)
+        return self.group_data[grp]
+
+    def update_labels(self):
+        self.fig.yaxis.axis_label = self.select_y.value
+        self.fig.xaxis.axis_label = 'Plan Date'
+        self.histogram.xaxis.axis_label = self.select_y.value
+        self.ichart.yaxis.axis_label = self.select_y.value
+
+    def update_plot(self, grp):
+        self.source[grp]['plot'].data = self.get_plot_data(grp)
+
+    def update_summary(self, grp):
+        try:
+            y = self.group_data[grp]['y']
+            self.div_summary[grp].text = "<b>Linac %s</b>: <b>Min</b>: %0.3f | <b>Low</b>: %0.3f | " \
+                                         "<b>Mean</b>: %0.3f | <b>Median</b>: %0.3f | <b>Upper</b>: %0.3f | " \
+                                         "<b>Max</b>: %0.3f" % \
+                                         (grp, np.min(y), np.percentile(y, 25), np.sum(y)/len(y),
+                                          np.percentile(y, 50), np.percentile(y, 75), np.max(y))
+        except:
+            self.div_summary[grp].text = "<b>Linac %s</b>" % grp
 
     def update_histogram(self, group):
         width_fraction = 0.9
@@ -306,7 +580,7 @@ class TrendingDashboard:
         except ValueError:
             bin_size = 20
             self.bins_input.value = str(bin_size)
-        hist, bins = np.histogram(self.source[group]['plot'].data['y'], bins=bin_size)
+        hist, bins = np.histogram(self.group_data[group]['y'], bins=bin_size)
         width = [width_fraction * (bins[1] - bins[0])] * bin_size
         center = (bins[:-1] + bins[1:]) / 2.
         if set(hist) != {0}:
@@ -314,16 +588,14 @@ class TrendingDashboard:
         else:
             self.source[group]['hist'].data = {'x': [], 'top': [], 'width': []}
 
-        self.histogram.xaxis.axis_label = self.select_y.value
-
     def update_trend(self, source_key, avg_len, percentile):
-        x = self.source[source_key]['plot'].data['x']
-        y = self.source[source_key]['plot'].data['y']
-        if x and y:
+        x = self.group_data[source_key]['x']
+        y = self.group_data[source_key]['y']
+        if len(x) and len(y):
             data_collapsed = collapse_into_single_dates(x, y)
             x_trend, y_trend = moving_avg(data_collapsed, avg_len)
 
-            y_np = np.array(self.source[source_key]['plot'].data['y'])
+            y_np = np.array(y)
             upper_bound = float(np.percentile(y_np, 50. + percentile / 2.))
             average = float(np.percentile(y_np, 50))
             lower_bound = float(np.percentile(y_np, 50. - percentile / 2.))
@@ -342,58 +614,253 @@ class TrendingDashboard:
             self.source[source_key]['bound'].data = {'x': [], 'mrn': [], 'upper': [], 'avg': [], 'lower': [], 'y': []}
             self.source[source_key]['patch'].data = {'x': [], 'y': []}
 
-    def update_ichart(self):
-        self.ichart.yaxis.axis_label = self.select_y.value
+    def update_control_chart(self, grp):
+        y = self.group_data[grp]['y']
+        self.control_limit_sums[grp] = get_control_limit_sums(y)
+        center_line, ucl, lcl = self.get_control_limits(grp)
+        in_control = (ucl >= y) & (y >= lcl)
+
+        self.ichart_group_data[grp] = get_ichart_columns(self.group_data[grp], 0, in_control)
+        self.update_control_limits(grp)
+
+    def update_ichart_plot(self, grp):
+        self.ichart_source[grp]['plot'].data = self.get_ichart_data(grp)
+
+    def get_control_limits(self, grp):
+        """
+        :return: center line, upper control limit, and lower control limit of a group, see control_limit_sums
+        :rtype: tuple
+        """
+        center_line, ucl, lcl = get_control_limits_from_sums(self.control_limit_sums[grp])
+
+        if self.select_y.value in ['Gamma-Index', 'DTA'] and ucl > 100:
+            ucl = 100
+
+        return center_line, ucl, lcl
+
+    def update_control_limits(self, grp):
+        """
+        Update the control limit lines, region, and divs of a group
+        """
+        center_line, ucl, lcl = self.get_control_limits(grp)
+        x = self.ichart_group_data[grp]['x']
+
+        if len(x) > 1:
+            self.ichart_source[grp]['patch'].data = {'x': [x[0], x[-1], x[-1], x[0]],
+                                                     'y': [ucl, ucl, lcl, lcl]}
+            self.ichart_source[grp]['center_line'].data = {'x': [min(x), max(x)],
+                                                           'y': [center_line] * 2,
+                                                           'mrn': ['center line'] * 2}
+
+            self.ichart_source[grp]['lcl_line'].data = {'x': [min(x), max(x)],
+                                                        'y': [lcl] * 2,
+                                                        'mrn': ['center line'] * 2}
+            self.ichart_source[grp]['ucl_line'].data = {'x': [min(x), max(x)],
+                                                        'y': [ucl] * 2,
+                                                        'mrn': ['center line'] * 2}
+
+            self.div_center_line[grp].text = "<b>Center line</b>: %0.3f" % center_line
+            self.div_ucl[grp].text = "<b>UCL</b>: %0.3f" % ucl
+            self.div_lcl[grp].text = "<b>LCL</b>: %0.3f" % lcl
+        else:
+            self.ichart_source[grp]['patch'].data = {'x': [], 'y': []}
+            self.ichart_source[grp]['center_line'].data = {'x': [], 'y': [], 'mrn': []}
+            self.ichart_source[grp]['lcl_line'].data = {'x': [], 'y': [], 'mrn': []}
+            self.ichart_source[grp]['ucl_line'].data = {'x': [], 'y': [], 'mrn': []}
+
+            self.div_center_line[grp].text = "<b>Center line</b>:"
+            self.div_ucl[grp].text = "<b>UCL</b>:"
+            self.div_lcl[grp].text = "<b>LCL</b>:"
+
+    def get_level_of_detail(self, data, x, x_range):
+        """
+        :param data: columns of every filtered point, including y
+        :type data: dict
+        :param x: numeric x of each point, in the units of x_range
+        :type x: np.ndarray
+        :param x_range: bokeh Range of the plot, used to refine the points in view
+        :return: data with only the points sent to the browser, see max_plot_points
+        :rtype: dict
+        """
+        if self.max_plot_points is None:
+            return data
+        indices = get_level_of_detail_indices(x, data['y'], self.max_plot_points,
+                                              x_start=x_range.start, x_end=x_range.end)
+        return {key: values[indices] for key, values in data.items()}
+
+    def get_plot_data(self, group):
+        data = self.group_data[group]
+        x = data['x'].astype('datetime64[ms]').astype(float)  # bokeh datetime ranges are milliseconds since epoch
+        return self.get_level_of_detail(data, x, self.fig.x_range)
+
+    def get_ichart_data(self, group):
+        data = self.ichart_group_data[group]
+        return self.get_level_of_detail(data, data['x'], self.ichart.x_range)
+
+    ##########################################################
+    # Live mode
+    ##########################################################
+    def update_live(self):
+        """
+        Periodic callback of the live mode, rows appended to the results csv since it was last read are added to the
+        plots with ColumnDataSource.stream and patch. The dataset is reloaded if the results file was replaced (e.g.,
+        rows of re-processed reports removed by --canonical).
+        """
+        state = get_results_file_state(self.file_path)
+        if state is None or state == self.file_state:
+            return
+        if self.file_state is None or state[0] != self.file_state[0] or state[1] < self.file_state[1]:
+            self.reload()
+            return
+
+        new_data, offset = read_appended_results(self.file_path, self.file_state[1])
+        self.file_state = (state[0], offset)
+        if new_data is not None:
+            self.append_rows(new_data)
+
+    def get_dataset_file_state(self):
+        """
+        :return: inode and size of the results csv when the dataset was read, in the format of get_results_file_state,
+                 so rows appended later are read by update_live exactly once
+        :rtype: tuple
+        """
+        file_state = self.dataset.file_state
+        return None if file_state is None else (file_state['inode'], file_state['size'])
+
+    def reload(self):
+        self.dataset = get_dataset(self.file_path, day_first=self.day_first)
+        self.data = self.dataset.data
+        self.file_state = self.get_dataset_file_state()
+        self.__set_x()
+        self.__set_filter_data()
+        self.update_options()
+        self.update()
 
+    def append_rows(self, new_data):
+        """
+        Add rows to the dataset, rows dated on or after the last date are streamed to the plots (along with rows of the
+        last date newly shown when the end date follows them), otherwise the rows are merged into the dataset and
+        every view is updated
+        :param new_data: output from read_appended_results
+        :type new_data: dict
+        """
+        if set(new_data) != set(self.data) - {'date_time_obj'}:  # columns changed, e.g., a new version of the parser
+            self.reload()
+            return
+
+        for key, values in new_data.items():  # same types as the columns of import_csv
+            if self.data[key].dtype.kind == 'f' and values.dtype.kind != 'f':
+                float_values = to_float_array(values)
+                new_data[key] = np.full(len(values), np.nan) if float_values is None else float_values
+            elif self.data[key].dtype.kind != 'f' and values.dtype.kind == 'f':
+                new_data[key] = values.astype(str).astype(object)
+        new_data['date_time_obj'] = get_date_times(new_data, day_first=self.day_first)
+        order = np.argsort(new_data['date_time_obj'].astype('datetime64[D]'), kind='stable')
+        new_data = {key: values[order] for key, values in new_data.items()}
+
+        start = len(self.x)
+        previous_last_date = self.dates[-1] if start else None
+        # new arrays rather than in place, so arrays already passed to bokeh are not changed
+        self.data = {key: np.concatenate([values, new_data[key]]) for key, values in self.data.items()}
+
+        if start and new_data['date_time_obj'][0] < self.x[-1]:
+            order = np.argsort(self.data['date_time_obj'].astype('datetime64[D]'), kind='stable')
+            self.data = {key: values[order] for key, values in self.data.items()}
+            self.__set_x()
+            self.__set_filter_data()
+            self.update_options()
+            self.update()
+            return
+
+        self.__set_x()
+        self.append_filter_data(new_data)
+        self.update_options()
+        start = self.follow_end_date(previous_last_date, start)
+
+        # memoized values of the graph are updated in place of invalidating the views
+        y_data = self.get_y_data(self.select_y.value)
+        mask = self.get_shared_mask(y_data)
+        self.graph.set('y_data', y_data)
+        self.graph.set('shared_mask', mask)
         for grp in GROUPS:
-            y = self.source[grp]['plot'].data['y']
-            mrn = self.source[grp]['plot'].data['id']
-            dates = self.source[grp]['plot'].data['x']
-            gamma_crit = self.source[grp]['plot'].data['gamma_crit']
-            gamma_index = self.source[grp]['plot'].data['gamma_index']
-            daily_corr = self.source[grp]['plot'].data['daily_corr']
-            dta = self.source[grp]['plot'].data['dta']
-            file_name = self.source[grp]['plot'].data['file_name']
-            x = list(range(len(dates)))
-
-            center_line, ucl, lcl = get_control_limits(y)
-
-            if self.select_y.value in ['Gamma-Index', 'DTA'] and ucl > 100:
-                ucl = 100
-
-            colors = ['red', 'blue']
-            alphas = [0.3, 0.4]
-            color = [colors[ucl >= value >= lcl] for value in y]
-            alpha = [alphas[ucl >= value >= lcl] for value in y]
-
-            self.ichart_source[grp]['plot'].data = {'x': x, 'y': y, 'mrn': mrn, 'gamma_crit': gamma_crit,
-                                                    'gamma_index': gamma_index, 'daily_corr': daily_corr, 'dta': dta,
-                                                    'color': color, 'alpha': alpha, 'dates': dates,
-                                                    'file_name': file_name}
-
-            if len(x) > 1:
-                self.ichart_source[grp]['patch'].data = {'x': [x[0], x[-1], x[-1], x[0]],
-                                                         'y': [ucl, ucl, lcl, lcl]}
-                self.ichart_source[grp]['center_line'].data = {'x': [min(x), max(x)],
-                                                               'y': [center_line] * 2,
-                                                               'mrn': ['center line'] * 2}
-
-                self.ichart_source[grp]['lcl_line'].data = {'x': [min(x), max(x)],
-                                                            'y': [lcl] * 2,
-                                                            'mrn': ['center line'] * 2}
-                self.ichart_source[grp]['ucl_line'].data = {'x': [min(x), max(x)],
-                                                            'y': [ucl] * 2,
-                                                            'mrn': ['center line'] * 2}
-
-                self.div_center_line[grp].text = "<b>Center line</b>: %0.3f" % center_line
-                self.div_ucl[grp].text = "<b>UCL</b>: %0.3f" % ucl
-                self.div_lcl[grp].text = "<b>LCL</b>: %0.3f" % lcl
-            else:
-                self.ichart_source[grp]['patch'].data = {'x': [], 'y': []}
-                self.ichart_source[grp]['center_line'].data = {'x': [], 'y': [], 'mrn': []}
-                self.ichart_source[grp]['lcl_line'].data = {'x': [], 'y': [], 'mrn': []}
-                self.ichart_source[grp]['ucl_line'].data = {'x': [], 'y': [], 'mrn': []}
-
-                self.div_center_line[grp].text = "<b>Center line</b>:"
-                self.div_ucl[grp].text = "<b>UCL</b>:"
-                self.div_lcl[grp].text = "<b>LCL</b>:"
+            group_data = self.get_group_data(grp, mask[start:], y_data, start=start)
+            if len(group_data['y']):
+                self.append_group_data(grp, group_data)
+
+    def follow_end_date(self, previous_last_date, start):
+        """
+        If the end date picker was not before the last date, move it past the new last date so appended rows are shown.
+        The views are not updated, rows newly in the date range are all at the end of the date sorted data, so they
+        can be streamed along with the appended rows.
+        :param previous_last_date: last date before rows were appended
+        :type previous_last_date: np.datetime64
+        :param start: index of the first appended row
+        :type start: int
+        :return: index of the first row not in the date range before rows were appended
+        :rtype: int
+        """
+        end_date = get_date_picker_value(self.end_date_picker)
+        if previous_last_date is not None and (end_date < previous_last_date or end_date > self.dates[-1]):
+            return start
+
+        # the filters use end_date exclusively
+        self.end_date_picker.remove_on_change('value', self.input_callbacks['dates'])
+        self.end_date_picker.value = (self.dates[-1] + np.timedelta64(1, 'D')).tolist()
+        self.end_date_picker.on_change('value', self.input_callbacks['dates'])
+        self.graph.set('dates', (self.start_date_picker.value, self.end_date_picker.value))
+
+        return int(np.searchsorted(self.dates[:start], end_date))
+
+    def update_options(self):
+        """
+        Update linac and energy options, e.g., after reports of a new linac are added
+        """
+        linacs = ['All'] + self.linac_categories.tolist() + ['None']
+        energies = ['Any'] + self.energy_categories.tolist()
+        for grp in GROUPS:
+            self.select_linac[grp].options = linacs
+            self.select_energies[grp].options = energies
+
+    def append_group_data(self, grp, new_data):
+        """
+        :param grp: group of the linac and energy filters
+        :type grp: int
+        :param new_data: output from get_group_data for the appended rows
+        :type new_data: dict
+        """
+        old_count = len(self.group_data[grp]['y'])
+        self.group_data[grp] = {key: np.concatenate([values, new_data[key]])
+                                for key, values in self.group_data[grp].items()}
+        self.graph.set('group_data_%s' % grp, self.group_data[grp])
+        if self.max_plot_points is None:
+            self.source[grp]['plot'].stream(new_data)
+        else:
+            self.source[grp]['plot'].data = self.get_plot_data(grp)
+
+        self.update_summary(grp)
+        self.update_histogram(grp)
+        self.update_trend(grp, self.graph.get('avg_len'), self.graph.get('percentile'))
+
+        # control limits are updated from running sums, points changing between in and out of control are patched
+        previous_in_control = self.ichart_group_data[grp]['color'] == ICHART_COLORS[1]
+        self.control_limit_sums[grp] = get_control_limit_sums(new_data['y'], self.control_limit_sums[grp])
+        center_line, ucl, lcl = self.get_control_limits(grp)
+        y = self.group_data[grp]['y']
+        in_control = (ucl >= y) & (y >= lcl)
+
+        new_ichart_data = get_ichart_columns(new_data, old_count, in_control[old_count:])
+        self.ichart_group_data[grp] = {key: np.concatenate([values, new_ichart_data[key]])
+                                       for key, values in self.ichart_group_data[grp].items()}
+        self.ichart_group_data[grp]['color'] = ICHART_COLORS[in_control.astype(int)]
+        self.ichart_group_data[grp]['alpha'] = ICHART_ALPHAS[in_control.astype(int)]
+
+        if self.max_plot_points is None:
+            changed = np.flatnonzero(in_control[:old_count] != previous_in_control)
+            if len(changed):
+                self.ichart_source[grp]['plot'].patch(
+                    {'color': [(int(i), ICHART_COLORS[int(in_control[i])]) for i in changed],
+                     'alpha': [(int(i), float(ICHART_ALPHAS[int(in_control[i])])) for i in changed]})
+            self.ichart_source[grp]['plot'].stream(new_ichart_data)
+        else:
+            self.ichart_source[grp]['plot'].data = self.get_ichart_data(grp)
+        self.update_control_limits(grp)
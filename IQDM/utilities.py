@@ -5,17 +5,31 @@ Created on Thu May 30 2019
 @author: Dan Cutright, PhD
 """
 
-from os.path import isdir, join, splitext, normpath
-from os import walk, listdir
+from os.path import isfile, join, splitext, normpath, getmtime
+from os import walk, listdir, replace, stat, fstat, fsync
 import zipfile
 from datetime import datetime
 from dateutil.parser import parse as date_parser
 import numpy as np
-import codecs
+import io
+import json
 
 DELIMITER = ','  # delimiter for the csv output file for process_files
 ALTERNATE = '^'  # replace the delimiter character with this so not to confuse csv file parsing
 
+# import_csv will not convert these columns to floats, even if every value is a number, e.g., categories used as
+# labels and filter options of the trending dashboards (a linac named 1 is not 1.0)
+TEXT_COLUMNS = ['Patient Name', 'Patient Last Name', 'Patient First Name', 'Patient ID', 'Plan Date', 'Notes',
+                'file_name', 'Energy', 'Radiation Dev', 'Gamma Dose Criteria', 'Gamma Dist Criteria', 'Difference (%)',
+                'Distance (mm)']
+MISSING_VALUES = ['', 'None', 'none', 'n/a', 'N/A', 'nan', 'NaN']  # import_csv converts these to nan in numeric columns
+BINARY_RESULTS_EXTENSION = '.npy'  # results csv files may have a memory-mappable copy, see write_binary_results
+BINARY_RESULTS_STATE_EXTENSION = '.npy.json'  # size, mtime, and inode of the csv when its binary copy was written
+ZIP_MEMBER_SEPARATOR = '!'  # pdfs read from zip files are named <archive>.zip!<member>
+MAX_PLOT_POINTS = 2000  # suggested points in view for the level-of-detail mode of the trending dashboards
+
+OPEN_ARCHIVE = {}  # most recently read zip file, see read_file_data
+
 
 def are_all_strings_in_text(text, list_of_strings):
     """
@@ -49,34 +63,157 @@ def get_csv(data, columns):
     return DELIMITER.join(clean_csv)
 
 
-def load_csv_file(file_path):
-    with codecs.open(file_path, 'r', encoding='utf-8', errors='ignore') as doc:
-        return [line.split(',') for line in doc]
+def load_csv_file(file_path, size=None):
+    """
+    :param file_path: csv file
+    :type file_path: str
+    :param size: only read this many bytes of the file, read the whole file if None
+    :type size: int
+    :return: each line, split by DELIMITER
+    :rtype: list
+    """
+    with open(file_path, 'rb') as doc:
+        text = (doc.read() if size is None else doc.read(size)).decode('utf-8', errors='ignore')
+    return [line.split(',') for line in text.splitlines()]
 
 
 def import_csv(file_path, day_first=False):
-    raw_data = load_csv_file(file_path)
-    keys = raw_data.pop(0)  # remove column header row
-    keys = [key.strip() for key in keys if key.strip()] + ['file_name']
-    data = {key: [] for key in keys}
-    for row in raw_data:
-        for col, key in enumerate(keys):
-            data[key].append(row[col])
+    """
+    Load an IQDM results csv into columns sorted by Plan Date. If a binary results store created after the csv exists,
+    it is memory-mapped instead of parsing the csv.
+    :param file_path: results csv file created by process_files
+    :type file_path: str
+    :param day_first: assume day first for ambiguous dates
+    :type day_first: bool
+    :return: a numpy array for each column, numeric columns are float arrays (nan if missing), plus file_name and
+             date_time_obj columns
+    :rtype: dict
+    """
+    return import_csv_with_state(file_path, day_first=day_first)[0]
+
 
-    sorted_data = {key: [] for key in keys}
-    sorted_data['date_time_obj'] = []
+def import_csv_with_state(file_path, day_first=False):
+    """
+    :param file_path: results csv file created by process_files
+    :type file_path: str
+    :param day_first: assume day first for ambiguous dates
+    :type day_first: bool
+    :return: output from import_csv, and the state of the csv it was read from (see get_csv_file_state) with the
+             size of its complete rows, rows appended later start at this size
+    :rtype: tuple
+    """
+    data, state = None, read_binary_results_state(file_path)
+    if isfile(get_binary_results_path(file_path)) and state == get_csv_file_state(file_path):
+        data = load_binary_results(get_binary_results_path(file_path))
+        if read_binary_results_state(file_path) != state:  # rows appended to the store while it was loaded
+            data = None
+    if data is None:
+        data, state = read_complete_results_csv(file_path)
 
     date_time_objs = get_date_times(data, day_first=day_first)
+    sorted_indices = np.argsort(date_time_objs.astype('datetime64[D]'), kind='stable')
+
+    sorted_data = {key: data[key][sorted_indices] for key in list(data)}
+    sorted_data['date_time_obj'] = date_time_objs[sorted_indices]
+
+    return sorted_data, state
+
+
+def read_results_csv(file_path, size=None):
+    """
+    :param file_path: results csv file created by process_files
+    :type file_path: str
+    :param size: only read this many bytes of the file, read the whole file if None
+    :type size: int
+    :return: a numpy array for each column in file order, numeric columns are float arrays (nan if missing), the
+             file path of each report is stored in the file_name column
+    :rtype: dict
+    """
+    raw_data = load_csv_file(file_path, size=size)
+    return get_results_columns(raw_data.pop(0), raw_data)
 
-    for i in get_sorted_indices(date_time_objs):
-        for key in keys:
-            sorted_data[key].append(data[key][i])
-        sorted_data['date_time_obj'].append(date_time_objs[i])
 
-    return sorted_data
+def read_complete_results_csv(file_path):
+    """
+    :param file_path: results csv file created by process_files
+    :type file_path: str
+    :return: output from read_results_csv without a partially written last row, and the state of file_path with the
+             size of the rows read
+    :rtype: tuple
+    """
+    with open(file_path, 'rb') as doc:
+        file_stat = fstat(doc.fileno())
+        content = doc.read(file_stat.st_size)
+    size = content.rfind(b'\n') + 1 or len(content)
+    raw_data = [line.split(DELIMITER) for line in content[:size].decode('utf-8', errors='ignore').splitlines()]
+    state = {'size': size, 'mtime': file_stat.st_mtime, 'inode': file_stat.st_ino}
+    return get_results_columns(raw_data.pop(0), raw_data), state
+
+
+def get_results_columns(header, raw_data):
+    """
+    :param header: column header row of a results csv, split by DELIMITER
+    :type header: list
+    :param raw_data: the other rows of the results csv, each split by DELIMITER
+    :type raw_data: list
+    :return: a numpy array for each column, see read_results_csv
+    :rtype: dict
+    """
+    data = get_raw_results_columns(header, raw_data)
+    for key in list(data):
+        if key not in TEXT_COLUMNS:
+            float_values = to_float_array(data[key])
+            if float_values is not None and not np.all(np.isnan(float_values)):
+                data[key] = float_values
+
+    return data
+
+
+def get_raw_results_columns(header, raw_data):
+    """
+    :param header: column header row of a results csv, split by DELIMITER
+    :type header: list
+    :param raw_data: the other rows of the results csv, each split by DELIMITER
+    :type raw_data: list
+    :return: an object array of the str values of each column, see get_results_columns
+    :rtype: dict
+    """
+    keys = [key.strip() for key in header if key.strip()]
+    column_count = len(keys)
+
+    # file paths may contain the delimiter, anything after the last column is the file_name
+    rows = [row if len(row) == column_count + 1 else row[:column_count] + [DELIMITER.join(row[column_count:])]
+            for row in raw_data if len(row) > column_count]
+    keys.append('file_name')
+    columns = zip(*rows) if rows else [[] for _ in keys]
+    data = {key: np.array(values, dtype=object) for key, values in zip(keys, columns)}
+    data['file_name'] = np.array([file_name.strip() for file_name in data['file_name']], dtype=object)
+    return data
+
+
+def to_float_array(values):
+    """
+    :param values: column values from a results csv
+    :type values: np.ndarray
+    :return: values as floats with MISSING_VALUES converted to nan, None if any other value is not a number
+    :rtype: np.ndarray
+    """
+    try:
+        return np.asarray(values).astype(float)
+    except ValueError:
+        pass
+    missing = set(MISSING_VALUES)
+    try:
+        return np.array([['nan', value][value.strip() not in missing] for value in values]).astype(float)
+    except ValueError:
+        return None
 
 
 def get_file_names_from_csv_file(file_path):
+    if is_binary_results_current(file_path):
+        binary_results = load_binary_results(get_binary_results_path(file_path))
+        return [normpath(file_name) for file_name in binary_results['file_name']]
+
     raw_data = load_csv_file(file_path)
     column_headers = raw_data.pop(0)  # remove column header row
     fp_start = len(column_headers)
@@ -88,6 +225,239 @@ def get_file_names_from_csv_file(file_path):
     return file_names
 
 
+def get_results_file_state(file_path):
+    """
+    :param file_path: results csv file
+    :type file_path: str
+    :return: inode and size of file_path, used to detect appended rows and replaced files, None if not found
+    :rtype: tuple
+    """
+    try:
+        file_stat = stat(file_path)
+    except OSError:
+        return None
+    return file_stat.st_ino, file_stat.st_size
+
+
+def read_appended_results(file_path, offset):
+    """
+    Read the rows appended to a results csv since offset, a partially written last row is left for the next read
+    :param file_path: results csv file created by process_files
+    :type file_path: str
+    :param offset: size in bytes of the file when last read, see get_results_file_state
+    :type offset: int
+    :return: the new rows in the format of read_results_csv (None if there are none), and the offset of the end of
+             the last complete row
+    :rtype: tuple
+    """
+    with open(file_path, 'rb') as doc:
+        header = doc.readline()
+        doc.seek(offset)
+        new_bytes = doc.read()
+
+    end = new_bytes.rfind(b'\n') + 1
+    if not end:
+        return None, offset
+    lines = new_bytes[:end].decode('utf-8', errors='ignore').splitlines()
+    raw_data = [line.split(DELIMITER) for line in lines if line.strip()]
+    if not raw_data:
+        return None, offset + end
+    header = header.decode('utf-8', errors='ignore').strip().split(DELIMITER)
+    return get_results_columns(header, raw_data), offset + end
+
+
+#############################################################
+# Binary results store
+#############################################################
+def get_binary_results_path(csv_file_path):
+    return splitext(csv_file_path)[0] + BINARY_RESULTS_EXTENSION
+
+
+def get_binary_results_state_path(csv_file_path):
+    return splitext(csv_file_path)[0] + BINARY_RESULTS_STATE_EXTENSION
+
+
+def get_csv_file_state(csv_file_path):
+    """
+    :param csv_file_path: results csv file
+    :type csv_file_path: str
+    :return: size, modification time, and inode of csv_file_path
+    :rtype: dict
+    """
+    file_stat = stat(csv_file_path)
+    return {'size': file_stat.st_size, 'mtime': file_stat.st_mtime, 'inode': file_stat.st_ino}
+
+
+def read_binary_results_state(csv_file_path):
+    """
+    :param csv_file_path: results csv file
+    :type csv_file_path: str
+    :return: the state of csv_file_path when its binary results store was written, None if not found or the store
+             was written with different TEXT_COLUMNS
+    :rtype: dict
+    """
+    try:
+        with open(get_binary_results_state_path(csv_file_path), 'r') as doc:
+            state = json.load(doc)
+    except (IOError, OSError, ValueError):
+        return None
+    if state.pop('text_columns', None) != TEXT_COLUMNS:
+        return None
+    return state
+
+
+def write_binary_results_state(csv_file_path, state):
+    state_path = get_binary_results_state_path(csv_file_path)
+    with open(state_path + '.tmp', 'w') as doc:
+        json.dump(dict(state, text_columns=TEXT_COLUMNS), doc)
+    replace(state_path + '.tmp', state_path)
+
+
+def is_binary_results_current(csv_file_path):
+    """
+    :param csv_file_path: results csv file
+    :type csv_file_path: str
+    :return: True if a binary results store exists for csv_file_path and the csv is unchanged since it was written
+    :rtype: bool
+    """
+    return isfile(get_binary_results_path(csv_file_path)) and \
+        read_binary_results_state(csv_file_path) == get_csv_file_state(csv_file_path)
+
+
+def update_binary_results(csv_file_path):
+    """
+    Write the binary results store of a results csv if not current. If rows were only appended to the csv since the
+    store was written, they are appended to the store, otherwise the store is written again.
+    :param csv_file_path: results csv file
+    :type csv_file_path: str
+    :return: file path of the binary results store
+    :rtype: str
+    """
+    state = read_binary_results_state(csv_file_path)
+    current_state = get_csv_file_state(csv_file_path)
+    if state == current_state and isfile(get_binary_results_path(csv_file_path)):
+        return get_binary_results_path(csv_file_path)
+    if state is not None and state.get('inode') == current_state['inode'] and state['size'] < current_state['size'] \
+            and append_binary_results(csv_file_path, state['size'], current_state):
+        write_binary_results_state(csv_file_path, current_state)
+        return get_binary_results_path(csv_file_path)
+    return write_binary_results(csv_file_path)
+
+
+def write_binary_results(csv_file_path):
+    """
+    Save the columns of a results csv as a numpy structured array (.npy), which can be memory-mapped by
+    load_binary_results. Numeric columns are stored as float64, other columns as fixed width unicode.
+    :param csv_file_path: results csv file
+    :type csv_file_path: str
+    :return: file path of the binary results store
+    :rtype: str
+    """
+    state = get_csv_file_state(csv_file_path)  # rows appended while reading are left for update_binary_results
+    data = read_results_csv(csv_file_path, size=state['size'])
+    dtype = []
+    for key, values in data.items():
+        if values.dtype.kind == 'f':
+            dtype.append((key, 'f8'))
+        else:
+            dtype.append((key, 'U%s' % max([1] + [len(value) for value in values])))
+
+    binary_results = np.empty(len(data['file_name']), dtype=dtype)
+    for key, values in data.items():
+        binary_results[key] = values
+
+    # write to a temporary file first so a dashboard never memory-maps a partially written file
+    binary_file_path = get_binary_results_path(csv_file_path)
+    temp_path = binary_file_path + '.tmp'
+    with open(temp_path, 'wb') as doc:
+        np.save(doc, binary_results)
+    replace(temp_path, binary_file_path)
+    write_binary_results_state(csv_file_path, state)
+
+    return binary_file_path
+
+
+def append_binary_results(csv_file_path, offset, state):
+    """
+    Append the rows added to a results csv after offset to its binary results store, in place
+    :param csv_file_path: results csv file
+    :type csv_file_path: str
+    :param offset: size of the csv when the binary results store was last written
+    :type offset: int
+    :param state: current output of get_csv_file_state
+    :type state: dict
+    :return: False if the rows do not fit the columns of the store (e.g., a longer text value), which must then be
+             written again by write_binary_results
+    :rtype: bool
+    """
+    with open(csv_file_path, 'rb') as doc:
+        header = doc.readline().decode('utf-8', errors='ignore').strip().split(DELIMITER)
+        doc.seek(offset)
+        new_bytes = doc.read(state['size'] - offset)
+    if not new_bytes.endswith(b'\n'):  # partially written row
+        return False
+    new_data = get_raw_results_columns(header, [line.split(DELIMITER) for line in
+                                                new_bytes.decode('utf-8', errors='ignore').splitlines()])
+
+    binary_file_path = get_binary_results_path(csv_file_path)
+    with open(binary_file_path, 'rb+') as doc:
+        version = np.lib.format.read_magic(doc)
+        if version not in {(1, 0), (2, 0)}:
+            return False
+        read_header, write_header = {(1, 0): (np.lib.format.read_array_header_1_0,
+                                              np.lib.format.write_array_header_1_0),
+                                     (2, 0): (np.lib.format.read_array_header_2_0,
+                                              np.lib.format.write_array_header_2_0)}[version]
+        shape, fortran_order, dtype = read_header(doc)
+        data_offset = doc.tell()
+        if len(shape) != 1 or fortran_order or list(dtype.names) != list(new_data):
+            return False
+
+        new_results = np.empty(len(new_data['file_name']), dtype=dtype)
+        for key, values in new_data.items():
+            float_values = None if key in TEXT_COLUMNS else to_float_array(values)
+            if dtype[key].kind == 'f':
+                if float_values is None:
+                    return False
+            elif float_values is not None and len(values) and not np.all(np.isnan(float_values)) and \
+                    dtype[key].itemsize // 4 <= max([len(value) for value in MISSING_VALUES]) and \
+                    to_float_array(np.load(binary_file_path, mmap_mode='r')[key]) is not None:
+                # previous rows were all missing, so read_results_csv would now find a numeric column
+                return False
+            elif max([0] + [len(value) for value in values]) > dtype[key].itemsize // 4:
+                return False
+            new_results[key] = values if float_values is None or dtype[key].kind != 'f' else float_values
+
+        header_data = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                       'shape': (shape[0] + len(new_results),)}
+        new_header = io.BytesIO()
+        write_header(new_header, header_data)
+        if len(new_header.getvalue()) != data_offset or doc.seek(0, 2) != data_offset + shape[0] * dtype.itemsize:
+            return False
+
+        # rows first, then the header, so a dashboard loading the store sees either the previous or the new rows
+        doc.write(new_results.tobytes())
+        doc.flush()
+        fsync(doc.fileno())
+        doc.seek(0)
+        doc.write(new_header.getvalue())
+        doc.flush()
+        fsync(doc.fileno())
+    return True
+
+
+def load_binary_results(binary_file_path, mmap_mode='r'):
+    """
+    :param binary_file_path: output from write_binary_results
+    :type binary_file_path: str
+    :param mmap_mode: passed to numpy.load, set to None to read the whole file into memory
+    :return: a read-only array for each column, in the same format as read_results_csv
+    :rtype: dict
+    """
+    binary_results = np.load(binary_file_path, mmap_mode=mmap_mode)
+    return {key: binary_results[key] for key in binary_results.dtype.names}
+
+
 #############################################################
 # Plotting and Stat related functions
 #############################################################
@@ -96,25 +466,19 @@ def collapse_into_single_dates(x, y):
     Function used for a time plot to convert multiple values into one value, while retaining enough information
     to perform a moving average over time
     :param x: a list of dates in ascending order
-    :param y: a list of values and can use the '+' operator as a function of date
+    :param y: a list of values
     :return: a unique list of dates, sum of y for that date, and number of original points for that date
     :rtype: dict
     """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    if not len(x):
+        return {'x': x, 'y': y, 'w': np.zeros(0, dtype=int)}
 
-    # average daily data and keep track of points per day
-    x_collapsed = [x[0]]
-    y_collapsed = [y[0]]
-    w_collapsed = [1]
-    for n in range(1, len(x)):
-        if x[n] == x_collapsed[-1]:
-            y_collapsed[-1] = (y_collapsed[-1] + y[n])
-            w_collapsed[-1] += 1
-        else:
-            x_collapsed.append(x[n])
-            y_collapsed.append(y[n])
-            w_collapsed.append(1)
+    # index of the first point of each date
+    starts = np.concatenate([[0], np.flatnonzero(x[1:] != x[:-1]) + 1])
 
-    return {'x': x_collapsed, 'y': y_collapsed, 'w': w_collapsed}
+    return {'x': x[starts], 'y': np.add.reduceat(y, starts), 'w': np.diff(np.append(starts, len(x)))}
 
 
 def moving_avg(xyw, avg_len):
@@ -122,23 +486,114 @@ def moving_avg(xyw, avg_len):
     Calculate a moving average for a given averaging length
     :param xyw: output from collapse_into_single_dates
     :type xyw: dict
-    :param avg_len: average of these number of points, i.e., look-back window
-    :type avg_len: int
-    :return: list of x values, list of y values
+    :param avg_len: average of these number of points (the daily average of each date), i.e., look-back window.
+                    Alternatively, a calendar window as np.timedelta64 (e.g., np.timedelta64(30, 'D')) to average
+                    every point within that many days, returned only for dates with a complete window
+    :type avg_len: int or np.timedelta64
+    :return: array of x values, array of y values
     :rtype: tuple
     """
-    cumsum, moving_aves, x_final = [0], [], []
-
-    for i, y in enumerate(xyw['y'], 1):
-        cumsum.append(cumsum[i - 1] + y / xyw['w'][i - 1])
-        if i >= avg_len:
-            moving_ave = (cumsum[i] - cumsum[i - avg_len]) / avg_len
-            moving_aves.append(moving_ave)
-    x_final = [xyw['x'][i] for i in range(avg_len - 1, len(xyw['x']))]
+    x = np.asarray(xyw['x'])
+    y = np.asarray(xyw['y'], dtype=float)
+    w = np.asarray(xyw['w'])
+
+    if isinstance(avg_len, np.timedelta64):
+        dates = x.astype('datetime64[D]')
+        window = avg_len.astype('timedelta64[D]')
+        cumsum_y = np.concatenate([[0.], np.cumsum(y)])
+        cumsum_w = np.concatenate([[0], np.cumsum(w)])
+        end = np.arange(1, len(dates) + 1)
+        start = np.searchsorted(dates, dates - window, side='right')  # dates within the window ending at each date
+        complete = np.flatnonzero(dates - window + np.timedelta64(1, 'D') >= dates[0]) if len(dates) else end[:0]
+        moving_aves = (cumsum_y[end] - cumsum_y[start]) / (cumsum_w[end] - cumsum_w[start])
+        return x[complete], moving_aves[complete]
+
+    cumsum = np.concatenate([[0.], np.cumsum(y / w)])
+    moving_aves = (cumsum[avg_len:] - cumsum[:-avg_len]) / avg_len if avg_len <= len(y) else y[:0]
+    x_final = x[avg_len - 1:]
 
     return x_final, moving_aves
 
 
+def get_avg_len(value):
+    """
+    :param value: text of an averaging length, a number of points (e.g., '10') or a calendar window in days
+                  (e.g., '30 days' or '30d')
+    :type value: str
+    :return: avg_len parameter of moving_avg
+    :rtype: int or np.timedelta64
+    """
+    value = str(value).strip().lower()
+    for suffix in ['days', 'day', 'd']:
+        if value.endswith(suffix):
+            return np.timedelta64(int(float(value[:-len(suffix)])), 'D')
+    return int(float(value))
+
+
+def get_lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling, the first and last points are kept and one point is kept from each of
+    threshold - 2 buckets, chosen to form the largest triangle with its neighbours so peaks and troughs are retained
+    :param x: numeric values in ascending order
+    :type x: np.ndarray
+    :param y: value of each x, no nan values
+    :type y: np.ndarray
+    :param threshold: maximum number of points returned
+    :type threshold: int
+    :return: indices of the points to keep, in ascending order
+    :rtype: np.ndarray
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    count = len(x)
+    if count <= threshold or threshold < 3:
+        return np.arange(count)
+
+    edges = np.linspace(1, count - 1, threshold - 1).astype(int)  # bucket i is edges[i] to edges[i + 1]
+    indices = np.empty(threshold, dtype=int)
+    indices[0], indices[-1] = 0, count - 1
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else count
+        x_next, y_next = np.mean(x[end:next_end]), np.mean(y[end:next_end])
+        x_prev, y_prev = x[indices[i]], y[indices[i]]
+        areas = np.abs((x_prev - x_next) * (y[start:end] - y_prev) - (x_prev - x[start:end]) * (y_next - y_prev))
+        indices[i + 1] = start + np.argmax(areas)
+
+    return indices
+
+
+def get_level_of_detail_indices(x, y, max_points, x_start=None, x_end=None):
+    """
+    Points of a series to send to a plot, so dense series do not send every point to the browser. Points between
+    x_start and x_end (and one point either side) are downsampled to max_points, the first and last points of the
+    series are always kept so auto-ranged axes keep their extents.
+    :param x: numeric values in ascending order, e.g., milliseconds since epoch for a bokeh datetime axis
+    :type x: np.ndarray
+    :param y: value of each x, no nan values
+    :type y: np.ndarray
+    :param max_points: maximum number of points in view, all points are returned if None
+    :type max_points: int
+    :param x_start: start of the visible x range, the start of the series if None
+    :type x_start: float
+    :param x_end: end of the visible x range, the end of the series if None
+    :type x_end: float
+    :return: indices of x and y, in ascending order
+    :rtype: np.ndarray
+    """
+    count = len(x)
+    if max_points is None or count <= max_points:
+        return np.arange(count)
+
+    first, last = 0, count
+    if x_start is not None and x_end is not None and np.isfinite(x_start) and np.isfinite(x_end):
+        first = max(0, int(np.searchsorted(x, x_start, side='left')) - 1)
+        last = min(count, int(np.searchsorted(x, x_end, side='right')) + 1)
+
+    indices = first + get_lttb_indices(x[first:last], y[first:last], max_points)
+    return np.union1d(indices, [0, count - 1])
+
+
 def get_sorted_indices(some_list):
     try:
         return [i[0] for i in sorted(enumerate(some_list), key=lambda x: x[1])]
@@ -152,16 +607,40 @@ def get_sorted_indices(some_list):
 
 
 def get_date_times(data, datetime_key='Plan Date', row_id_key='Patient ID', day_first=False):
-    dates = []
-    for i, date_str in enumerate(data[datetime_key]):
+    """
+    Parse each unique date string once, ISO dates are parsed in bulk by numpy unless day_first
+    :param data: output from import_csv
+    :type data: dict
+    :param datetime_key: column of date strings
+    :param row_id_key: column used to identify rows that could not be parsed
+    :param day_first: assume day first for ambiguous dates
+    :type day_first: bool
+    :return: datetime.date objects
+    :rtype: np.ndarray
+    """
+    date_strings = np.asarray(data[datetime_key], dtype=str)
+    unique_strings, inverse = np.unique(date_strings, return_inverse=True)
+
+    unique_dates = np.empty(len(unique_strings), dtype=object)
+    if not day_first:  # dateutil would swap month and day of ISO dates if day_first
         try:
-            dates.append(date_parser(date_str, dayfirst=day_first).date())
+            iso_dates = unique_strings.astype('datetime64[D]')
+            is_valid = ~np.isnat(iso_dates)
+            unique_dates[is_valid] = iso_dates[is_valid].tolist()
         except ValueError:
-            print('ERROR: Could not parse the following into a date: %s' % date_str)
-            print("\tPatient ID: %s" % data[row_id_key][i])
-            print("\tUsing today's date instead")
-            dates.append(datetime.today().date())
-    return dates
+            pass
+
+    for u, date_str in enumerate(unique_strings):
+        if unique_dates[u] is None:
+            try:
+                unique_dates[u] = date_parser(date_str, dayfirst=day_first).date()
+            except (ValueError, OverflowError):
+                print('ERROR: Could not parse the following into a date: %s' % date_str)
+                print("\tPatient ID: %s" % ', '.join(np.asarray(data[row_id_key])[inverse == u].astype(str)))
+                print("\tUsing today's date instead")
+                unique_dates[u] = datetime.today().date()
+
+    return unique_dates[inverse.reshape(-1)]
 
 
 def get_control_limits(y):
@@ -171,10 +650,41 @@ def get_control_limits(y):
     :type y: list
     :return: center line, upper control limit, and lower control limit
     """
-    y = np.array(y)
+    return get_control_limits_from_sums(get_control_limit_sums(y))
+
+
+def get_control_limit_sums(y, previous=None):
+    """
+    Running sums used to calculate control limits, so limits can be updated as values are appended
+    :param y: data, or the values appended since previous
+    :type y: list
+    :param previous: output of get_control_limit_sums for the values before y
+    :type previous: dict
+    :return: count, sum of y, sum of moving ranges, and the last value
+    :rtype: dict
+    """
+    y = np.asarray(y, dtype=float)
+    sums = {'count': 0, 'sum': 0., 'moving_range_sum': 0., 'last': None} if previous is None else dict(previous)
+    if len(y):
+        if sums['last'] is not None:
+            y_with_last = np.concatenate([[sums['last']], y])
+        else:
+            y_with_last = y
+        sums['count'] += len(y)
+        sums['sum'] += float(np.sum(y))
+        sums['moving_range_sum'] += float(np.sum(np.absolute(np.diff(y_with_last))))
+        sums['last'] = float(y[-1])
+    return sums
+
 
-    center_line = np.mean(y)
-    avg_moving_range = np.mean(np.absolute(np.diff(y)))
+def get_control_limits_from_sums(sums):
+    """
+    :param sums: output of get_control_limit_sums
+    :type sums: dict
+    :return: center line, upper control limit, and lower control limit
+    """
+    center_line = sums['sum'] / sums['count'] if sums['count'] else np.nan
+    avg_moving_range = sums['moving_range_sum'] / (sums['count'] - 1) if sums['count'] > 1 else np.nan
 
     scalar_d = 1.128
 
@@ -187,6 +697,65 @@ def get_control_limits(y):
 #############################################################
 # File related functions
 #############################################################
+def get_zip_member_paths(zip_file_path, extension='.pdf'):
+    """
+    :param zip_file_path: file path of a zip file
+    :type zip_file_path: str
+    :param extension: file extension of members to include, set to None to include all files
+    :type extension: str or None
+    :return: file paths of the members of the zip file, named <archive>.zip!<member>
+    :rtype: list
+    """
+    with zipfile.ZipFile(zip_file_path, 'r') as z:
+        return [zip_file_path + ZIP_MEMBER_SEPARATOR + info.filename for info in z.infolist()
+                if not info.filename.endswith('/') and
+                (extension is None or splitext(info.filename)[1].lower() == extension)]
+
+
+def split_zip_member_path(file_path):
+    """
+    :param file_path: a file path, or a zip member path from get_zip_member_paths
+    :type file_path: str
+    :return: zip file path and member name, or file_path and None if file_path is not a zip member
+    :rtype: tuple
+    """
+    index = file_path.lower().find('.zip' + ZIP_MEMBER_SEPARATOR)
+    if index > -1 and not isfile(file_path):
+        return file_path[:index + 4], file_path[index + 5:]
+    return file_path, None
+
+
+def read_file_data(file_path):
+    """
+    Read a file, or a member of a zip file, into memory. The most recently used zip file is kept open, so the central
+    directory of an archive is only read once while its members are processed, until close_open_archive is called.
+    :param file_path: a file path, or a zip member path from get_zip_member_paths
+    :type file_path: str
+    :return: content of the file
+    :rtype: bytes
+    """
+    zip_file_path, member = split_zip_member_path(file_path)
+    if member is None:
+        with open(file_path, 'rb') as doc:
+            return doc.read()
+
+    archive_key = (zip_file_path, getmtime(zip_file_path))
+    if archive_key not in OPEN_ARCHIVE:
+        close_open_archive()
+        OPEN_ARCHIVE[archive_key] = zipfile.ZipFile(zip_file_path, 'r')
+    return OPEN_ARCHIVE[archive_key].read(member)
+
+
+def close_open_archive():
+    """
+    Close the zip file kept open by read_file_data, e.g., once a scan is complete or in a new worker process so the
+    file handle of the parent process is not shared
+    """
+    for archive in OPEN_ARCHIVE.values():
+        archive.close()
+    OPEN_ARCHIVE.clear()
+
+
 def extract_files_from_zipped_files(init_directory, extract_to_path, extension='.pdf'):
     """
     Function to extract .pdf files from zipped files
@@ -199,13 +768,13 @@ def extract_files_from_zipped_files(init_directory, extract_to_path, extension='
     """
     for dirName, subdirList, fileList in walk(init_directory):  # iterate through files and all sub-directories
         for fileName in fileList:
-            if splitext(fileName)[1].lower == '.zip':
+            if splitext(fileName)[1].lower() == '.zip':
                 zip_file_path = join(dirName, fileName)
                 with zipfile.ZipFile(zip_file_path, 'r') as z:
                     for file_name in z.namelist():
-                        if not isdir(file_name) and (extension is None or splitext(file_name)[1].lower == extension):
-                            temp_path = join(extract_to_path)
-                            z.extract(file_name, path=temp_path)
+                        if not file_name.endswith('/') and \
+                                (extension is None or splitext(file_name)[1].lower() == extension):
+                            z.extract(file_name, path=extract_to_path)
 
 
 def find_latest_results(init_directory, no_recursive_search=False):
@@ -245,7 +814,10 @@ def process_result_csvs(file_list, results, directory_name=None):
                 result_info = file_name.split('_')
                 report_type = result_info[0]
                 time_stamp = result_info[2].replace(ext, '')
-                time_stamp = datetime.strptime(time_stamp[:-7], '%Y-%m-%d %H-%M-%S')
+                if time_stamp == 'canonical':  # canonical results are always up to date, see process_files
+                    time_stamp = datetime.max
+                else:
+                    time_stamp = datetime.strptime(time_stamp[:-7], '%Y-%m-%d %H-%M-%S')
 
                 if report_type and report_type not in results.keys() \
                         or results[report_type]['time_stamp'] < time_stamp: